@@ -0,0 +1,142 @@
+"""
+Benchmark cases. Each case is registered with @case(name) and returns the
+callable to time, doing any setup outside of it. Cases that need an optional
+dependency raise Skip from setup.
+"""
+
+import os
+import random
+
+from shared.map import GameMap, MAX_MAP_SIZE
+from shared.maps_campaign import is_walkable_subtile
+from shared.maps_endgame import generate_endgame_map
+
+MAP_SIZES = (16, 64, 128, MAX_MAP_SIZE)
+
+CASES = {}
+
+class Skip(Exception):
+    pass
+
+def case(name):
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+def sample_map(size):
+    """Deterministic random-walled map of size x size."""
+    random.seed(size)
+    return GameMap(size, size)
+
+def _server_state():
+    from server.core.state import init_state
+    return init_state()
+
+for size in MAP_SIZES:
+    @case(f"gamemap/from_grid/{size}")
+    def _(size=size):
+        grid = sample_map(size).grid
+        return lambda: GameMap.from_grid(grid)
+
+    @case(f"gamemap/generate/{size}")
+    def _(size=size):
+        return lambda: sample_map(size)
+
+    @case(f"pathfinding/planner/{size}")
+    def _(size=size):
+        from client.core.pathfinding import PathPlanner
+        game_map = sample_map(size)
+        return lambda: PathPlanner(game_map)
+
+    for distance in ("near", "far"):
+        @case(f"pathfinding/find_path/{size}/{distance}")
+        def _(size=size, distance=distance):
+            from client.core.pathfinding import find_path
+            game_map = sample_map(size)
+            if distance == "near":
+                sx, sy = game_map.nearest_walkable_cell(size // 2, size // 2)
+                gx, gy = game_map.nearest_walkable_cell(min(size - 1, sx + 8), min(size - 1, sy + 8))
+            else:
+                sx, sy = game_map.nearest_walkable_cell(0, 0)
+                gx, gy = game_map.nearest_walkable_cell(size - 1, size - 1)
+            start, goal = (sx, sy, 1, 1), (gx, gy, 1, 1)
+            find_path(game_map, start, goal)  # build the cached planner outside the timing
+            return lambda: find_path(game_map, start, goal)
+
+    @case(f"endgame/generate/{size}")
+    def _(size=size):
+        return lambda: generate_endgame_map(depth=1, width=size, height=size)
+
+    @case(f"move_validation/is_walkable_subtile/{size}")
+    def _(size=size):
+        game_map = sample_map(size)
+        # One full sweep of the map's tile positions per call
+        cells = [(x, y) for y in range(size) for x in range(size)]
+        def sweep():
+            for x, y in cells:
+                is_walkable_subtile(game_map, x, y, 1, 1)
+        return sweep
+
+@case("party/get_or_create/campaign")
+def _():
+    from server.core.party import get_or_create_party
+    return lambda: get_or_create_party(_server_state(), 1, 1)
+
+@case("party/get_or_create/endgame")
+def _():
+    from server.core.party import get_or_create_party
+    return lambda: get_or_create_party(_server_state(), 4, 1, endgame_depth=1)
+
+@case("server/welcome_message")
+def _():
+    try:
+        from server.core.server import welcome_message
+    except ImportError as e:
+        raise Skip(e)
+    from server.core.entities import KIND_PLAYER
+    from server.core.party import get_or_create_party
+    state = _server_state()
+    party_id = get_or_create_party(state, 1, 1)
+    client_id = "bench"
+    state['entity_ids'][client_id] = state['entities'].add(KIND_PLAYER, 1, 1)
+    state['player_info'][client_id] = {"class": "Brute", "stats": {"Strength": 10, "Agility": 5, "Mind": 3}}
+    return lambda: welcome_message(state, client_id, party_id, "bin1")
+
+def _pygame_assets():
+    try:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        import pygame
+    except ImportError as e:
+        raise Skip(e)
+    from client.core.sprites import load_sprites
+    pygame.display.init()
+    path = os.path.join(os.path.dirname(__file__), '..', 'assets', 'sprites_palette.json')
+    palette, tiles, chars, monsters, boss = load_sprites(path)
+    return pygame, palette, tiles, chars
+
+for size in (16, 64):
+    @case(f"render/draw_isometric_grid/{size}")
+    def _(size=size):
+        pygame, palette, tiles, _chars = _pygame_assets()
+        from client.core.render import draw_isometric_grid
+        screen = pygame.Surface((800, 600))
+        grid = sample_map(size).grid
+        return lambda: draw_isometric_grid(screen, grid, size, size, palette, tiles, 64, 32, 1.0)
+
+for size in (16, 64, MAX_MAP_SIZE):
+    @case(f"render/terrain_layer/{size}")
+    def _(size=size):
+        pygame, palette, tiles, _chars = _pygame_assets()
+        from client.core.terrain import TerrainLayer
+        screen = pygame.Surface((800, 600))
+        layer = TerrainLayer(sample_map(size).grid, size, size, palette, tiles, 64, 32, 1.0, screen.get_size())
+        layer.draw(screen)  # render the visible chunks outside the timing
+        return lambda: layer.draw(screen)
+
+@case("render/draw_sprite")
+def _():
+    pygame, palette, _tiles, chars = _pygame_assets()
+    from client.core.sprites import draw_sprite
+    screen = pygame.Surface((800, 600))
+    return lambda: draw_sprite(screen, chars["brute"], palette, 400, 300, 4)
@@ -0,0 +1,114 @@
+"""
+Run the microbenchmarks and compare them against stored baselines.
+
+    python bench/run.py                  # run everything, compare with bench/baselines.json
+    python bench/run.py pathfinding      # only cases whose name contains "pathfinding"
+    python bench/run.py --save           # record the results as the new baselines
+
+Each case is timed as the best per-call time over several repeats, with the
+call count per repeat calibrated to take about --min-time seconds. Cases slower
+than their baseline by more than --threshold are reported as regressions and
+make the run exit with status 1. Baselines are machine specific; re-record them
+when switching machines.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import json
+import platform
+import time
+
+from cases import CASES, Skip
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baselines.json')
+DEFAULT_THRESHOLD = 0.25
+
+def measure(fn, min_time, repeat):
+    """Best per-call time in microseconds."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best * 1_000_000
+
+def load_baselines(path):
+    try:
+        with open(path) as f:
+            return json.load(f)["results"]
+    except (OSError, ValueError, KeyError):
+        return {}
+
+def format_us(us):
+    if us >= 1000:
+        return f"{us / 1000:9.2f} ms"
+    return f"{us:9.2f} us"
+
+def main():
+    parser = argparse.ArgumentParser(description="Core engine microbenchmarks")
+    parser.add_argument("filter", nargs="*", help="only run cases whose name contains one of these")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="write the results to the baseline file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="relative slowdown reported as a regression")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per repeat")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    baselines = load_baselines(args.baseline)
+    results = {}
+    regressions = []
+    print(f"{'case':48s} {'time':>12s} {'baseline':>12s} {'change':>8s}")
+    for name, setup in CASES.items():
+        if args.filter and not any(f in name for f in args.filter):
+            continue
+        try:
+            fn = setup()
+        except Skip as e:
+            print(f"{name:48s} skipped ({e})")
+            continue
+        us = results[name] = measure(fn, args.min_time, args.repeat)
+        base = baselines.get(name)
+        if base:
+            change = us / base - 1
+            flag = ""
+            if change > args.threshold:
+                flag = "  REGRESSION"
+                regressions.append(name)
+            elif change < -args.threshold:
+                flag = "  faster"
+            print(f"{name:48s} {format_us(us)} {format_us(base)} {change:+8.1%}{flag}")
+        else:
+            print(f"{name:48s} {format_us(us)} {'-':>12s}")
+
+    if args.save:
+        # Keep baselines of cases that were not run this time
+        merged = dict(load_baselines(args.baseline))
+        merged.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump({
+                "machine": f"{platform.machine()} {platform.processor() or platform.system()}",
+                "python": platform.python_version(),
+                "results": {k: round(v, 3) for k, v in sorted(merged.items())}
+            }, f, indent=2)
+            f.write("\n")
+        print(f"Saved {len(results)} results to {args.baseline}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
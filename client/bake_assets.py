@@ -0,0 +1,25 @@
+"""
+Bake the sprite palette JSON into the packed atlas the client loads at startup.
+
+    python client/bake_assets.py [assets/sprites_palette.json]
+
+The client bakes on its own when the cached atlas is missing or stale, so
+running this is optional; it moves that one-off cost out of the first launch
+(e.g. as an install or packaging step).
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+from core.atlas import bake_to_cache
+
+def main():
+    parser = argparse.ArgumentParser(description="Bake the client sprite atlas")
+    parser.add_argument("source", nargs="?", default=os.path.join(os.path.dirname(__file__), '..', 'assets', 'sprites_palette.json'))
+    args = parser.parse_args()
+    print(bake_to_cache(args.source))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import struct
+import pygame
+from core.mapcache import CACHE_DIR
+from core.sprites import preload_sprite_surface
+from shared.log import get_logger
+
+log = get_logger("client.assets")
+
+# Bump when the bundle layout or rasterization changes; older bundles are then rebaked
+ATLAS_VERSION = 1
+# Sprite pixel size the renderer draws at, so the baked pixels are used as they are
+ATLAS_SCALE = 4
+# Widest atlas row in pixels before starting a new one
+ATLAS_MAX_WIDTH = 512
+ATLAS_CACHE_DIR = os.path.join(CACHE_DIR, 'atlas')
+
+PALETTE_NAMES = (
+    "floor", "wall", "exit", "waypoint", "event", "boss",
+    "player_brute", "player_scout", "player_savant", "player_vanguard",
+    "monster_goblin", "monster_skeleton", "monster_slime", "boss_final"
+)
+SPRITE_GROUPS = ("tiles", "characters", "monsters", "boss")
+
+# Bundle file: header, JSON index, then the atlas as raw RGBA rows
+_MAGIC = b"ISOA"
+_HEADER = struct.Struct("<4sHHHI")  # magic, version, width, height, index length
+
+def source_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+def bundle_path(digest):
+    return os.path.join(ATLAS_CACHE_DIR, f"{digest}.v{ATLAS_VERSION}.atlas")
+
+def bake_atlas(source, scale=ATLAS_SCALE):
+    """Rasterize every sprite of a palette JSON document (bytes) into one RGBA atlas.
+
+    Returns the bundle bytes. Pure Python, so it runs without a display.
+    """
+    data = json.loads(source)
+    palette = [data["palette"][name] for name in PALETTE_NAMES]
+    # Shelf packing: sprites left to right, a new row when the current one is full
+    rects = {}
+    x = y = row_height = width = 0
+    for group in SPRITE_GROUPS:
+        for name, sprite in data[group].items():
+            w = max((len(row) for row in sprite), default=0) * scale
+            h = len(sprite) * scale
+            if x and x + w > ATLAS_MAX_WIDTH:
+                x, y, row_height = 0, y + row_height, 0
+            rects[f"{group}/{name}"] = [x, y, w, h]
+            x += w
+            row_height = max(row_height, h)
+            width = max(width, x)
+    height = y + row_height
+    pixels = bytearray(width * height * 4)
+    for group in SPRITE_GROUPS:
+        for name, sprite in data[group].items():
+            left, top, _, _ = rects[f"{group}/{name}"]
+            for r, row in enumerate(sprite):
+                for c, color_idx in enumerate(row):
+                    if color_idx == 0:
+                        continue  # transparent
+                    red, green, blue = palette[color_idx][:3]
+                    pixel = bytes((red, green, blue, 255)) * scale
+                    for dy in range(scale):
+                        offset = ((top + r*scale + dy) * width + left + c*scale) * 4
+                        pixels[offset:offset + len(pixel)] = pixel
+    index = json.dumps({
+        "scale": scale,
+        "palette": palette,
+        "sprites": {group: data[group] for group in SPRITE_GROUPS},
+        "rects": rects
+    }, separators=(",", ":")).encode()
+    return _HEADER.pack(_MAGIC, ATLAS_VERSION, width, height, len(index)) + index + bytes(pixels)
+
+def bake_to_cache(sprite_path):
+    """Bake the atlas for a palette JSON file into the cache, unless it is already there. Returns its path."""
+    with open(sprite_path, 'rb') as f:
+        source = f.read()
+    path = bundle_path(source_hash(source))
+    if not os.path.exists(path):
+        _write_bundle(path, bake_atlas(source))
+    return path
+
+def _write_bundle(path, bundle):
+    try:
+        os.makedirs(ATLAS_CACHE_DIR, exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(bundle)
+        os.replace(tmp, path)
+    except OSError as e:
+        log.warning("Could not cache sprite atlas: %s", e)
+        return
+    # Bundles for older sources or versions are never read again
+    for name in os.listdir(ATLAS_CACHE_DIR):
+        stale = os.path.join(ATLAS_CACHE_DIR, name)
+        if name.endswith('.atlas') and stale != path:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+def _parse_bundle(bundle):
+    magic, version, width, height, index_length = _HEADER.unpack_from(bundle)
+    if magic != _MAGIC or version != ATLAS_VERSION:
+        raise ValueError("Not a current sprite atlas")
+    offset = _HEADER.size + index_length
+    if len(bundle) != offset + width * height * 4:
+        raise ValueError("Truncated sprite atlas")
+    index = json.loads(bytes(memoryview(bundle)[_HEADER.size:offset]))
+    return index, width, height, offset
+
+def load_sprite_bundle(sprite_path):
+    """load_sprites() backed by the baked atlas: one read of the bundle, no per-pixel work.
+
+    The atlas is baked (and cached under the hash of the JSON source) on a
+    miss. Each sprite's region of the atlas is installed in the sprite
+    surface cache, so the first frames blit baked pixels straight away.
+    """
+    with open(sprite_path, 'rb') as f:
+        source = f.read()
+    path = bundle_path(source_hash(source))
+    try:
+        with open(path, 'rb') as f:
+            bundle = f.read()
+        index, width, height, offset = _parse_bundle(bundle)
+    except (OSError, ValueError, struct.error) as e:
+        log.info("Baking sprite atlas (%s)", e)
+        bundle = bake_atlas(source)
+        _write_bundle(path, bundle)
+        index, width, height, offset = _parse_bundle(bundle)
+    atlas = pygame.image.frombuffer(memoryview(bundle)[offset:], (width, height), "RGBA")
+    if pygame.display.get_surface() is not None:
+        atlas = atlas.convert_alpha()
+    palette = index["palette"]
+    sprites = index["sprites"]
+    for group in SPRITE_GROUPS:
+        for name, sprite in sprites[group].items():
+            surface = atlas.subsurface(pygame.Rect(index["rects"][f"{group}/{name}"]))
+            preload_sprite_surface(sprite, palette, index["scale"], surface)
+    return palette, sprites["tiles"], sprites["characters"], sprites["monsters"], sprites["boss"]
@@ -0,0 +1,128 @@
+import json
+from collections import OrderedDict
+from shared.map import CHUNK_SIZE, WALL, GameMap, chunk_of, map_hash, pack_grid, unpack_cells
+from core.mapcache import store_map
+from shared.log import get_logger
+
+log = get_logger("client.net")
+
+# Chunks held at once; the farthest are dropped (drawn as wall again) beyond this
+MAX_CACHED_CHUNKS = 36
+# Chunks around the player's own that are asked for if the server hasn't sent them (1 = the 3x3 block)
+REQUEST_RADIUS = 1
+
+class MapStream:
+    """Chunks of the current map received so far, for maps not in the local cache.
+
+    The server sends the chunks around the player, and the chunks ahead of a
+    walk before the player gets there. Chunks arrive into a full-size GameMap
+    that starts out as wall, so rendering and path planning work on whatever
+    is known. Only MAX_CACHED_CHUNKS are kept in it. Every chunk received is
+    also copied into a separate assembly of the whole map, so once all of
+    them have been seen the map is verified against its hash and stored in
+    the map cache like a map_data reply, however many were dropped meanwhile.
+    """
+
+    def __init__(self, summary):
+        self.hash = summary['hash']
+        self.width = summary['width']
+        self.height = summary['height']
+        self.chunks_x = -(-self.width // CHUNK_SIZE)
+        self.chunks_y = -(-self.height // CHUNK_SIZE)
+        self.game_map = None
+        # (cx, cy) -> version, least recently received first
+        self.chunks = OrderedDict()
+        self.requested = set()
+        # The whole map as received, for the map cache; dropped once stored
+        self.assembled = GameMap(self.width, self.height, generate=False)
+        self.received = set()
+
+    def missing(self, pos):
+        """Chunks around tile position `pos` that are neither held nor already asked for."""
+        pcx, pcy = chunk_of(pos[0], pos[1])
+        r = REQUEST_RADIUS
+        return [
+            (cx, cy)
+            for cy in range(max(0, pcy - r), min(self.chunks_y, pcy + r + 1))
+            for cx in range(max(0, pcx - r), min(self.chunks_x, pcx + r + 1))
+            if (cx, cy) not in self.chunks and (cx, cy) not in self.requested
+        ]
+
+    def add(self, cx, cy, version, cells, pos):
+        """Install a received chunk, dropping the chunks farthest from `pos` if over the limit.
+
+        Returns the chunks whose tiles changed: this one and any dropped.
+        """
+        if self.game_map is None:
+            self.game_map = GameMap.filled(self.width, self.height, WALL)
+        self.game_map.set_chunk_cells(cx, cy, cells)
+        if self.assembled is not None:
+            self.assembled.set_chunk_cells(cx, cy, cells)
+            self.received.add((cx, cy))
+        self.chunks.pop((cx, cy), None)
+        self.chunks[(cx, cy)] = version
+        self.requested.discard((cx, cy))
+        changed = [(cx, cy)]
+        if len(self.chunks) > MAX_CACHED_CHUNKS:
+            pcx, pcy = chunk_of(pos[0], pos[1]) if pos else (cx, cy)
+            by_distance = sorted(self.chunks, key=lambda c: max(abs(c[0] - pcx), abs(c[1] - pcy)))
+            for far in by_distance[MAX_CACHED_CHUNKS:]:
+                del self.chunks[far]
+                _, _, w, h = self.game_map.chunk_bounds(*far)
+                self.game_map.set_chunk_cells(far[0], far[1], bytes([WALL]) * (w * h))
+                changed.append(far)
+        return changed
+
+    def complete(self):
+        return self.assembled is not None and len(self.received) == self.chunks_x * self.chunks_y
+
+def start_map_stream(state, summary):
+    """Begin receiving a map chunk by chunk. Returns the first chunk_request message to send."""
+    stream = state['map_stream'] = MapStream(summary)
+    state['map_grid'] = []
+    state['game_map'] = None
+    state['planner'] = None
+    state['map_dirty'] = set()
+    return chunk_request(state, stream.missing(state.get('player_pos') or (0, 0)))
+
+def chunk_request(state, chunks):
+    stream = state['map_stream']
+    stream.requested.update(chunks)
+    return json.dumps({"type": "chunk_request", "payload": {"hash": stream.hash, "chunks": [list(c) for c in chunks]}})
+
+def request_missing_chunks(state):
+    """A chunk_request for chunks around the predicted position the client doesn't have, or None."""
+    stream = state.get('map_stream')
+    pos = state.get('player_pos')
+    if stream is None or not pos:
+        return None
+    missing = stream.missing(pos)
+    return chunk_request(state, missing) if missing else None
+
+def apply_chunk(state, payload):
+    """Install a map_chunk message (also later versions of chunks already held)."""
+    stream = state.get('map_stream')
+    if stream is None or payload.get('hash') != stream.hash:
+        return
+    changed = stream.add(payload['cx'], payload['cy'], payload['version'], unpack_cells(payload['data']), state.get('player_pos'))
+    game_map = stream.game_map
+    if state.get('game_map') is not game_map:
+        # The grid's rows are patched in place from now on, so the renderer keeps its terrain layer
+        state['game_map'] = game_map
+        state['map_grid'] = game_map.grid
+        state['planner'] = None
+    planner = state.get('planner')
+    dirty = state.setdefault('map_dirty', set())
+    for cx, cy in changed:
+        rect = game_map.chunk_bounds(cx, cy)
+        dirty.add(rect)
+        if planner is not None:
+            planner.update(*rect)
+    if not stream.complete():
+        return
+    assembled, stream.assembled, stream.received = stream.assembled, None, set()
+    if map_hash(assembled) == stream.hash:
+        store_map(stream.hash, pack_grid(assembled))
+    else:
+        # Tiles changed since the map was opened; the chunks are current, just not what the hash names
+        log.debug("Streamed map %s differs from its welcome hash, not caching", stream.hash)
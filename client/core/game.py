@@ -1,36 +1,73 @@
 import pygame
-from .render import draw_isometric_grid, draw_player
+from .render import draw_player, draw_monster
+from .terrain import get_terrain
+
+BACKGROUND_COLOR = (30, 30, 30)
+
+def draw_background(screen, state, assets):
+    """The screen-sized terrain backdrop, rebuilt only when the terrain layer changes."""
+    if not state['map_grid'] or not assets['SPRITE_PALETTE'] or not assets['SPRITE_TILES']:
+        key = None
+    else:
+        terrain = get_terrain(state, assets, screen)
+        key = (id(terrain), terrain.revision)
+    frame = state.get('frame')
+    if frame is not None and frame['key'] == key and frame['background'].get_size() == screen.get_size():
+        return frame, False
+    background = pygame.Surface(screen.get_size())
+    if pygame.display.get_surface() is not None:
+        background = background.convert()
+    background.fill(BACKGROUND_COLOR)
+    if key is not None:
+        terrain.draw(background)
+    frame = state['frame'] = {"key": key, "background": background, "rects": []}
+    return frame, True
 
 def draw_game(screen, state, assets):
-    # print(f"[DEBUG] draw_game: map_grid={bool(state.get('map_grid'))}, map_height={state.get('map_height')}, map_width={state.get('map_width')}, player_pos={state.get('player_pos')}, player_class={state.get('player_class')}", flush=True)
-    draw_isometric_grid(
-        screen,
-        state['map_grid'],
-        state['map_height'],
-        state['map_width'],
-        assets['SPRITE_PALETTE'],
-        assets['SPRITE_TILES'],
-        assets['TILE_WIDTH'],
-        assets['TILE_HEIGHT'],
-        state['zoom']
-    )
+    """Draw the game scene. Returns the screen rects that changed, or None when the whole screen did.
+
+    Terrain comes from a cached backdrop, so a frame only restores the areas
+    entities covered last frame and draws the entities again.
+    """
+    frame, rebuilt = draw_background(screen, state, assets)
+    if rebuilt:
+        screen.blit(frame['background'], (0, 0))
+    else:
+        for rect in frame['rects']:
+            screen.blit(frame['background'], rect, rect)
+    rects = []
+    # Remote entities are drawn where the server had them a moment ago, interpolated between snapshots
+    position = state['snapshots'].position
+    render_time = state['snapshots'].render_time()
+    # Draw monsters replicated by the server
+    for eid, monster in state.get('monsters', {}).items():
+        rects.append(draw_monster(
+            screen,
+            position(eid, render_time, monster['pos']),
+            monster['type'],
+            assets['SPRITE_PALETTE'],
+            assets['SPRITE_MONSTERS'],
+            assets['TILE_WIDTH'],
+            assets['TILE_HEIGHT'],
+            state['zoom']
+        ))
     # Draw all players (multiplayer)
-    player_id = state.get('player_id')
+    entity_id = state.get('entity_id')
     # Draw other players first
-    for pid, pdata in state.get('other_players', {}).items():
-        if pid != player_id:
-            draw_player(
+    for eid, pdata in state.get('other_players', {}).items():
+        if eid != entity_id:
+            rects.append(draw_player(
                 screen,
-                pdata['pos'],
+                position(eid, render_time, pdata['pos']),
                 pdata.get('class', 'Brute'),
                 assets['SPRITE_PALETTE'],
                 assets['SPRITE_CHARACTERS'],
                 assets['TILE_WIDTH'],
                 assets['TILE_HEIGHT'],
                 state['zoom']
-            )
+            ))
     # Draw local player on top
-    draw_player(
+    rects.append(draw_player(
         screen,
         state['player_pos'],
         state['player_class'],
@@ -39,8 +76,12 @@ def draw_game(screen, state, assets):
         assets['TILE_WIDTH'],
         assets['TILE_HEIGHT'],
         state['zoom']
-    )
-    # ...add more draw calls for monsters, UI, etc...
+    ))
+    # ...add more draw calls for UI, etc...
+    rects = [rect for rect in rects if rect]
+    dirty = frame['rects'] + rects
+    frame['rects'] = rects
+    return None if rebuilt else dirty
 
 def draw_main_menu(screen):
     screen.fill((20, 20, 40))
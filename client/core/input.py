@@ -1,6 +1,10 @@
 import pygame
-import json
 from core.pathfinding import find_path
+from core.network import class_select_message, map_planner
+from core.prediction import start_path
+from shared.log import get_logger
+
+log = get_logger("client.input")
 
 # Input handling and game state update
 
@@ -8,11 +12,11 @@ def handle_input(event, state, send_queue):
     import math
     import pygame
     if event.type == pygame.QUIT:
-        print("[DEBUG] Quit event received.", flush=True)
+        log.debug("Quit event received.")
         return False
     # Example: handle movement keys
     if event.type == pygame.KEYDOWN:
-        print(f"[DEBUG] Keydown: {event.key}, scene: {state.get('scene')}", flush=True)
+        log.debug("Keydown: %s, scene: %s", event.key, state.get('scene'))
         if event.key == pygame.K_UP:
             # Example: move up
             state['player_pos'][1] = max(0, state['player_pos'][1] - 1)
@@ -35,65 +39,65 @@ def handle_input(event, state, send_queue):
         y = int((my_centered / (TILE_HEIGHT//2) - mx_centered / (TILE_WIDTH//2)) / 2)
         x = max(0, min(state.get('map_width', 0)-1, x))
         y = max(0, min(state.get('map_height', 0)-1, y))
-        print(f"[DEBUG] Map click at screen=({mx},{my}) -> map=({x},{y})", flush=True)
+        log.debug("Map click at screen=(%s,%s) -> map=(%s,%s)", mx, my, x, y)
         grid = state.get('map_grid', [])
         if grid and 0 <= y < len(grid) and 0 <= x < len(grid[0]) and grid[y][x] in (0, 2):
-            # Pathfind to clicked tile (center subtile)
-            from core.pathfinding import find_path
+            # Pathfind to clicked tile (center subtile) with the current map's planner,
+            # from the predicted position so a new click continues the walk smoothly
             start = tuple(state['player_pos'])
             goal = (x, y, 1, 1)
-            path = find_path(grid, start, goal)
+            planner = map_planner(state)
+            path = planner.find_path(start, goal) if planner else find_path(grid, start, goal)
             if path:
-                state['move_path'] = path[1:]  # Exclude current position
-                print(f"[DEBUG] Path found: {path}", flush=True)
+                start_path(state, path, send_queue)
+                log.debug("Path found: %s", path)
             else:
-                print(f"[DEBUG] No path found to ({x},{y})", flush=True)
+                log.debug("No path found to (%s,%s)", x, y)
     return True
 
 def handle_main_menu_input(event, state):
     if event.type == pygame.KEYDOWN:
-        print(f"[DEBUG] Main menu input: {event.key}", flush=True)
+        log.debug("Main menu input: %s", event.key)
         if event.key == pygame.K_RETURN:
             if state.get('network_ready'):
-                print("[DEBUG] Switching to character_select scene.", flush=True)
+                log.debug("Switching to character_select scene.")
                 state['scene'] = 'character_select'
             else:
-                print("[DEBUG] Network not ready, please wait...", flush=True)
+                log.debug("Network not ready, please wait...")
         elif event.key == pygame.K_ESCAPE:
-            print("[DEBUG] Escape pressed in main menu. Exiting.", flush=True)
+            log.debug("Escape pressed in main menu. Exiting.")
             return False
     return True
 
 def handle_character_select_input(event, state, send_queue):
     classes = ["Brute", "Scout", "Savant", "Vanguard"]
     if not state.get('network_ready'):
-        print("[DEBUG] Network not ready, cannot select class yet.", flush=True)
+        log.debug("Network not ready, cannot select class yet.")
         return True
     if event.type == pygame.KEYDOWN:
-        print(f"[DEBUG] Character select input: {event.key}", flush=True)
+        log.debug("Character select input: %s", event.key)
         if event.key in [pygame.K_1, pygame.K_KP1]:
             state['selected_class'] = classes[0]
-            print(f"[DEBUG] Selected class: {classes[0]}", flush=True)
+            log.debug("Selected class: %s", classes[0])
         elif event.key in [pygame.K_2, pygame.K_KP2]:
             state['selected_class'] = classes[1]
-            print(f"[DEBUG] Selected class: {classes[1]}", flush=True)
+            log.debug("Selected class: %s", classes[1])
         elif event.key in [pygame.K_3, pygame.K_KP3]:
             state['selected_class'] = classes[2]
-            print(f"[DEBUG] Selected class: {classes[2]}", flush=True)
+            log.debug("Selected class: %s", classes[2])
         elif event.key in [pygame.K_4, pygame.K_KP4]:
             state['selected_class'] = classes[3]
-            print(f"[DEBUG] Selected class: {classes[3]}", flush=True)
+            log.debug("Selected class: %s", classes[3])
         elif event.key == pygame.K_RETURN and state.get('selected_class'):
             # Send class selection to server (if connected)
-            import json
-            msg = json.dumps({"type": "class_select", "payload": {"class": state['selected_class']}})
-            print(f"[DEBUG] Sending class_select to server: {msg}", flush=True)
+            msg = class_select_message(state)
+            log.debug("Sending class_select to server: %s", msg)
             if send_queue:
                 send_queue.put_nowait(msg)
-            print("[DEBUG] Switching to game scene.", flush=True)
+            log.debug("Switching to game scene.")
             state['scene'] = 'game'  # Switch to game scene after selection
         elif event.key == pygame.K_ESCAPE:
-            print("[DEBUG] Escape pressed in character select. Returning to main menu.", flush=True)
+            log.debug("Escape pressed in character select. Returning to main menu.")
             state['scene'] = 'main_menu'
     return True
 
@@ -0,0 +1,100 @@
+import time
+from collections import deque
+from shared.protocol import DEFAULT_TICK_RATE, MOVE_STEPS_PER_SECOND
+
+# Extra delay, in server ticks, on top of one step's duration to absorb network jitter
+JITTER_TICKS = 1
+# Samples kept per entity
+MAX_SAMPLES = 32
+# How far past its newest sample an entity keeps moving, as a fraction of a step
+EXTRAPOLATION_STEPS = 0.25
+# Moves of more than this many tiles (zone entry, respawn) are shown as jumps
+MAX_INTERPOLATED_TILES = 3
+# Weight given to a later-than-expected frame when re-estimating the clock offset
+OFFSET_DRIFT = 0.05
+
+class SnapshotBuffer:
+    """Server positions of remote entities, stamped with server time, for rendering slightly in the past.
+
+    Tick frames carry the server tick number, so tick / tick_rate is the time
+    a position became true on the server. Entities are drawn at
+    render_time(), a fixed delay behind the estimated server clock. A
+    position there almost always lies between two received samples and can be
+    interpolated, however the frames were spaced when they arrived. Entities
+    therefore move smoothly at any frame rate and at low server tick rates.
+    """
+
+    def __init__(self, tick_rate=DEFAULT_TICK_RATE):
+        self.tick_rate = tick_rate
+        # Time one step is drawn over: a step per sample while walking, at most one step per tick
+        self.step_time = max(1.0 / tick_rate, 1.0 / MOVE_STEPS_PER_SECOND)
+        self.delay = self.step_time + JITTER_TICKS / tick_rate
+        # Local monotonic time minus server time, from the fastest frames seen
+        self.offset = None
+        # eid -> deque of (server time, position tuple), oldest first
+        self.tracks = {}
+
+    def observe(self, tick, now=None):
+        """Update the clock estimate from a frame for `tick` arriving now."""
+        now = time.monotonic() if now is None else now
+        sample = now - tick / self.tick_rate
+        if self.offset is None or sample < self.offset:
+            self.offset = sample
+        else:
+            # Let the estimate creep up so a temporary fast path doesn't pin it forever
+            self.offset += (sample - self.offset) * OFFSET_DRIFT
+
+    def render_time(self, now=None):
+        now = time.monotonic() if now is None else now
+        if self.offset is None:
+            return None
+        return now - self.offset - self.delay
+
+    def push(self, eid, tick, pos):
+        t = tick / self.tick_rate
+        pos = tuple(pos)
+        track = self.tracks.get(eid)
+        if track is None:
+            track = self.tracks[eid] = deque(maxlen=MAX_SAMPLES)
+        elif track:
+            last_t, last_pos = track[-1]
+            if t < last_t:
+                return
+            if t - last_t > self.step_time:
+                # Starting to move after standing still: move over one step's time, not the whole pause
+                track.append((t - self.step_time, last_pos))
+        track.append((t, pos))
+
+    def remove(self, eid):
+        self.tracks.pop(eid, None)
+
+    def clear(self):
+        self.tracks.clear()
+        self.offset = None
+
+    def position(self, eid, render_time, default=None):
+        """Position of an entity at `render_time` (server time), with fractional coordinates."""
+        track = self.tracks.get(eid)
+        if not track or render_time is None:
+            return default
+        # Forget samples that are entirely in the past, keeping the one before render_time
+        while len(track) > 2 and track[1][0] <= render_time:
+            track.popleft()
+        t0, p0 = track[0]
+        if render_time <= t0 or len(track) == 1:
+            return p0
+        for t1, p1 in list(track)[1:]:
+            if render_time <= t1:
+                return _lerp(p0, p1, (render_time - t0) / (t1 - t0))
+            t0, p0 = t1, p1
+        # Past the newest sample: continue the last segment briefly, then hold
+        ta, pa = track[-2]
+        if t0 <= ta:
+            return p0
+        ahead = min(render_time - t0, EXTRAPOLATION_STEPS * self.step_time)
+        return _lerp(pa, p0, 1.0 + ahead / (t0 - ta))
+
+def _lerp(a, b, f):
+    if abs(a[0] - b[0]) + abs(a[1] - b[1]) > MAX_INTERPOLATED_TILES:
+        return b if f >= 1.0 else a
+    return tuple(x + (y - x) * f for x, y in zip(a, b))
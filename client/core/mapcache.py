@@ -0,0 +1,34 @@
+import os
+from shared.map import map_hash, unpack_grid
+from shared.log import get_logger
+
+log = get_logger("client.net")
+
+# Local cache of maps received from the server, keyed by content hash
+CACHE_DIR = os.environ.get('ISO_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'isometricRoguelike')
+MAP_CACHE_DIR = os.path.join(CACHE_DIR, 'maps')
+
+def _map_path(h):
+    return os.path.join(MAP_CACHE_DIR, f"{h}.map")
+
+def load_cached_map(h, width, height):
+    """Return the cached grid for a map hash, or None on a miss or a corrupt entry."""
+    try:
+        with open(_map_path(h), 'r') as f:
+            grid = unpack_grid(f.read(), width, height)
+    except (OSError, ValueError):
+        return None
+    if map_hash(grid) != h:
+        return None
+    return grid
+
+def store_map(h, packed):
+    """Persist a packed grid (as sent by the server) under its hash."""
+    try:
+        os.makedirs(MAP_CACHE_DIR, exist_ok=True)
+        tmp = _map_path(h) + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(packed)
+        os.replace(tmp, _map_path(h))
+    except OSError as e:
+        log.warning("Could not cache map %s: %s", h, e)
@@ -1,79 +1,214 @@
 import asyncio
+import random
 import websockets
 import json
+from shared.map import GameMap, map_hash, unpack_grid
+from shared.protocol import CODEC_JSON, DEFAULT_TICK_RATE, decode_message
+from core.chunks import apply_chunk, request_missing_chunks, start_map_stream
+from core.mapcache import load_cached_map, store_map
+from core.interpolation import SnapshotBuffer
+from core.pathfinding import PathPlanner
+from core.prediction import apply_correction, reconcile
+from shared.log import get_logger
+
+log = get_logger("client.net")
+
+# Seconds to wait before reconnecting; doubles after each failed attempt
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 10.0
+
+def set_map(state, grid):
+    """Install a received map: the raw rows for rendering, a packed GameMap and its path planner."""
+    state['map_grid'] = grid
+    state['game_map'] = GameMap.from_grid(grid)
+    state['planner'] = PathPlanner(state['game_map'])
+    state.pop('map_stream', None)
+
+def map_planner(state):
+    """The path planner for the current map, built on first use; streamed chunks update it in place."""
+    if state.get('planner') is None and state.get('game_map') is not None:
+        state['planner'] = PathPlanner(state['game_map'])
+    return state.get('planner')
+
+def apply_move(state, entity_id, pos):
+    """Apply a server-authoritative move to the local player or another party member."""
+    if not pos or entity_id is None:
+        return
+    if entity_id == state.get('entity_id'):
+        log.debug("Server move: player at %s", pos)
+        reconcile(state, pos)
+    else:
+        # Update other player's position
+        if 'other_players' not in state:
+            state['other_players'] = {}
+        if entity_id not in state['other_players']:
+            state['other_players'][entity_id] = {"pos": pos, "class": "Brute"}
+        else:
+            state['other_players'][entity_id]['pos'] = pos
+        log.debug("Other player %s moved to %s", entity_id, pos)
+
+def class_select_message(state):
+    return json.dumps({"type": "class_select", "payload": {
+        "class": state['selected_class'], "codecs": state.get('codecs'), "profile_id": state.get('profile_id')
+    }})
+
+async def on_welcome(websocket, state, payload):
+    state['player_id'] = payload['client_id']
+    state['entity_id'] = payload.get('entity_id')
+    state['codec'] = payload.get('codec', CODEC_JSON)
+    map_data = payload.get('map')
+    if map_data:
+        state['map_hash'] = map_data['hash']
+        state['map_width'] = map_data['width']
+        state['map_height'] = map_data['height']
+        state['in_city'] = map_data.get('city', False)
+        grid = load_cached_map(map_data['hash'], map_data['width'], map_data['height'])
+        if grid:
+            set_map(state, grid)
+        else:
+            # Cache miss: stream the map in chunks, starting with the ones around us
+            if payload.get('player_pos'):
+                state['player_pos'] = payload['player_pos']
+            await websocket.send(start_map_stream(state, map_data))
+            log.debug("Map %s not cached, streaming it from the server", map_data['hash'])
+    else:
+        log.warning("No map data in welcome message!")
+    player_info = payload.get('player_info')
+    if player_info:
+        state['player_class'] = player_info.get('class')
+        log.debug("Player class set from server: %s", state['player_class'])
+    player_pos = payload.get('player_pos')
+    if player_pos:
+        state['player_pos'] = player_pos
+        log.debug("Player position set from server: %s", state['player_pos'])
+    # Reset other_players and monsters; the server replicates those in range
+    state['other_players'] = {}
+    state['monsters'] = {}
+    # Tick numbers restart with the worker we are now connected to
+    snapshots = state['snapshots'] = SnapshotBuffer(payload.get('tick_rate') or DEFAULT_TICK_RATE)
+    if 'tick' in payload:
+        snapshots.observe(payload['tick'])
+    # A welcome also follows a zone change; drop any path walked on the previous map
+    state.pop('prediction', None)
+
+async def on_tick(websocket, state, payload):
+    # One frame per server tick with the entities in our area of interest
+    snapshots = state.get('snapshots')
+    tick = payload.get('tick')
+    if snapshots is not None and tick is not None:
+        snapshots.observe(tick)
+    else:
+        snapshots = None
+    for move in payload.get('moves', []):
+        apply_move(state, move.get('eid'), move.get('pos'))
+        if snapshots is not None and move.get('eid') != state.get('entity_id') and move.get('pos'):
+            snapshots.push(move['eid'], tick, move['pos'])
+    for monster in payload.get('monsters', []):
+        state.setdefault('monsters', {})[monster['eid']] = monster
+        if snapshots is not None:
+            snapshots.push(monster['eid'], tick, monster['pos'])
+    for entity_id in payload.get('removed', []):
+        state.get('other_players', {}).pop(entity_id, None)
+        state.get('monsters', {}).pop(entity_id, None)
+        if snapshots is not None:
+            snapshots.remove(entity_id)
+    # Ask for chunks we walked into that the server hasn't streamed (or that were dropped)
+    request = request_missing_chunks(state)
+    if request:
+        await websocket.send(request)
+
+async def on_correction(websocket, state, payload):
+    apply_correction(state, payload)
+
+async def on_map_data(websocket, state, payload):
+    if payload['hash'] == state.get('map_hash'):
+        grid = unpack_grid(payload['data'], payload['width'], payload['height'])
+        if map_hash(grid) == payload['hash']:
+            set_map(state, grid)
+            store_map(payload['hash'], payload['data'])
+        else:
+            log.warning("Map data failed hash check: %s", payload['hash'])
+
+async def on_map_chunk(websocket, state, payload):
+    apply_chunk(state, payload)
+
+# Server message type -> handler(websocket, state, payload)
+MESSAGE_HANDLERS = {
+    'welcome': on_welcome,
+    'tick': on_tick,
+    'correction': on_correction,
+    'map_data': on_map_data,
+    'map_chunk': on_map_chunk,
+}
+
+async def handle_message(websocket, state, data):
+    """Apply one decoded server message to the client state, replying on `websocket` where needed."""
+    handler = MESSAGE_HANDLERS.get(data.get('type'))
+    if handler is None:
+        log.debug("Unhandled message type: %s", data.get('type'))
+        return
+    await handler(websocket, state, data.get('payload') or {})
+
+async def read_loop(websocket, state):
+    """Apply server messages as they arrive, until the connection closes."""
+    async for message in websocket:
+        try:
+            data = decode_message(message)
+        except ValueError as e:
+            log.warning("Undecodable message from server: %s", e)
+            continue
+        await handle_message(websocket, state, data)
+
+async def write_loop(websocket, send_queue):
+    """Send queued messages as soon as they are queued.
+
+    Everything already waiting is sent in one go, so a burst of input goes out
+    back to back instead of one message per wake-up.
+    """
+    while True:
+        batch = [await send_queue.get()]
+        while not send_queue.empty():
+            batch.append(send_queue.get_nowait())
+        for message in batch:
+            await websocket.send(message)
+
+def resume_session(state, send_queue):
+    """After a reconnect, replace anything queued for the old session with a new class selection."""
+    if state.get('scene') != 'game' or not state.get('selected_class'):
+        return
+    while not send_queue.empty():
+        send_queue.get_nowait()
+    state.pop('prediction', None)
+    # The server restores our progress from the profile
+    send_queue.put_nowait(class_select_message(state))
+    log.info("Rejoining as %s", state['selected_class'])
 
 async def network_loop(uri, send_queue, recv_queue, state):
+    delay = RECONNECT_MIN_DELAY
     while True:
         try:
-            print(f"[DEBUG] Attempting to connect to server at {uri}...", flush=True)
+            log.debug("Attempting to connect to server at %s...", uri)
             async with websockets.connect(uri) as websocket:
-                print("[DEBUG] Connected to server.", flush=True)
+                log.info("Connected to server.")
+                delay = RECONNECT_MIN_DELAY
+                resume_session(state, send_queue)
                 state['network_ready'] = True
-                # Main message loop
-                while True:
-                    # Send any queued messages
-                    try:
-                        msg = send_queue.get_nowait()
-                        await websocket.send(msg)
-                        print(f"[DEBUG] Sent to server: {msg}", flush=True)
-                    except asyncio.QueueEmpty:
-                        pass
-                    # Receive and process messages
-                    try:
-                        message = await asyncio.wait_for(websocket.recv(), timeout=0.05)
-                        print(f"[DEBUG] Received from server: {message}", flush=True)
-                        data = json.loads(message)
-                        if data.get('type') == 'welcome':
-                            payload = data['payload']
-                            state['player_id'] = payload['client_id']
-                            map_data = payload.get('map')
-                            if map_data:
-                                state['map_grid'] = map_data['grid']
-                                state['map_width'] = map_data['width']
-                                state['map_height'] = map_data['height']
-                                state['in_city'] = map_data.get('city', False)
-                            else:
-                                print("[DEBUG] No map data in welcome message!", flush=True)
-                            player_info = payload.get('player_info')
-                            if player_info:
-                                state['player_class'] = player_info.get('class')
-                                print(f"[DEBUG] Player class set from server: {state['player_class']}", flush=True)
-                            player_pos = payload.get('player_pos')
-                            if player_pos:
-                                state['player_pos'] = player_pos
-                                print(f"[DEBUG] Player position set from server: {state['player_pos']}", flush=True)
-                            # Reset other_players
-                            state['other_players'] = {}
-                        elif data.get('type') == 'move':
-                            # Server authoritative move: update player position
-                            payload = data.get('payload', {})
-                            pos = payload.get('pos')
-                            move_client_id = payload.get('client_id')
-                            if pos and move_client_id:
-                                if move_client_id == state.get('player_id'):
-                                    state['player_pos'] = pos
-                                    print(f"[DEBUG] Server move: player_pos set to {pos}", flush=True)
-                                    # Remove the step from move_path if it matches
-                                    if 'move_path' in state and state['move_path']:
-                                        if tuple(pos) == tuple(state['move_path'][0]):
-                                            state['move_path'] = state['move_path'][1:]
-                                            if not state['move_path']:
-                                                del state['move_path']
-                                    state['move_waiting'] = False
-                                else:
-                                    # Update other player's position
-                                    if 'other_players' not in state:
-                                        state['other_players'] = {}
-                                    if move_client_id not in state['other_players']:
-                                        state['other_players'][move_client_id] = {"pos": pos, "class": "Brute"}
-                                    else:
-                                        state['other_players'][move_client_id]['pos'] = pos
-                                    print(f"[DEBUG] Other player {move_client_id} moved to {pos}", flush=True)
-                        # ...handle other message types as needed...
-                    except asyncio.TimeoutError:
-                        await asyncio.sleep(0.01)
-                        continue
+                tasks = [
+                    asyncio.create_task(read_loop(websocket, state)),
+                    asyncio.create_task(write_loop(websocket, send_queue))
+                ]
+                try:
+                    done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    for task in tasks:
+                        task.cancel()
+                for task in done:
+                    # Re-raise whatever ended the connection
+                    task.result()
+                log.warning("Server closed the connection.")
         except Exception as e:
-            print(f"[DEBUG] Network error: {e}", flush=True)
-            state['network_ready'] = False
-            await asyncio.sleep(0.5)
+            log.warning("Network error: %s", e)
+        state['network_ready'] = False
+        # Exponential backoff with jitter so restarted servers aren't stampeded
+        await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+        delay = min(delay * 2, RECONNECT_MAX_DELAY)
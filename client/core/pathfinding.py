@@ -1,35 +1,172 @@
 import heapq
-from shared.maps_campaign import SUBTILES_PER_TILE, is_walkable_subtile
+import weakref
+from array import array
+from shared.map import CHUNK_SIZE, GameMap
+from shared.maps_campaign import SUBTILES_PER_TILE
+
+class PathPlanner:
+    """Two-level click-to-move planner for one map.
+
+    Built once when a map arrives: labels the connected regions of walkable tiles
+    so unreachable goals are rejected without searching. Regions are labelled per
+    map chunk and joined across chunk borders, so update() after a chunk changes
+    (e.g. one streamed in) only relabels that chunk. Queries run A* over tiles
+    (flat integer indices, no tuples), then refine the tile corridor into
+    (x, y, sx, sy) subtile steps.
+    """
+
+    def __init__(self, game_map):
+        self.game_map = game_map
+        self.width = game_map.width
+        self.height = game_map.height
+        self.walkable = bytearray(game_map.walkable)
+        self.regions = array('i', [0]) * (self.width * self.height)
+        self.next_label = 1
+        for cy in range(-(-self.height // CHUNK_SIZE)):
+            for cx in range(-(-self.width // CHUNK_SIZE)):
+                self._label_chunk(cx, cy)
+        self._link()
+
+    def _label_chunk(self, cx, cy):
+        """Give each connected walkable area inside one chunk a fresh label."""
+        w, walkable, regions = self.width, self.walkable, self.regions
+        x0, y0 = cx * CHUNK_SIZE, cy * CHUNK_SIZE
+        x1, y1 = min(w, x0 + CHUNK_SIZE), min(self.height, y0 + CHUNK_SIZE)
+        blank = array('i', [0]) * (x1 - x0)
+        for y in range(y0, y1):
+            regions[y*w + x0:y*w + x1] = blank
+        label = self.next_label
+        for y in range(y0, y1):
+            for seed in range(y*w + x0, y*w + x1):
+                if not walkable[seed] or regions[seed]:
+                    continue
+                regions[seed] = label
+                stack = [seed]
+                while stack:
+                    i = stack.pop()
+                    x, ty = i % w, i // w
+                    for n in (i - w if ty > y0 else -1, i + w if ty < y1 - 1 else -1,
+                              i - 1 if x > x0 else -1, i + 1 if x < x1 - 1 else -1):
+                        if n >= 0 and walkable[n] and not regions[n]:
+                            regions[n] = label
+                            stack.append(n)
+                label += 1
+        self.next_label = label
+
+    def _link(self):
+        """Join chunk-local labels that touch across chunk borders into regions."""
+        w, h, regions = self.width, self.height, self.regions
+        parent = {}
+
+        def find(a):
+            while parent.get(a, a) != a:
+                parent[a] = parent.get(parent[a], parent[a])
+                a = parent[a]
+            return a
+
+        def join(a, b):
+            if a and b and a != b:
+                ra, rb = find(a), find(b)
+                if ra != rb:
+                    parent[ra] = rb
+
+        for x in range(CHUNK_SIZE, w, CHUNK_SIZE):
+            for y in range(h):
+                join(regions[y*w + x - 1], regions[y*w + x])
+        for y in range(CHUNK_SIZE, h, CHUNK_SIZE):
+            above, below = (y - 1) * w, y * w
+            for x in range(w):
+                join(regions[above + x], regions[below + x])
+        self.roots = {label: find(label) for label in parent}
+
+    def update(self, x, y, width, height):
+        """Pick up changed tiles in a rectangle of the map, relabelling only the chunks it covers."""
+        w, source = self.width, self.game_map.walkable
+        for ty in range(y, y + height):
+            self.walkable[ty*w + x:ty*w + x + width] = source[ty*w + x:ty*w + x + width]
+        for cy in range(y // CHUNK_SIZE, (y + height - 1) // CHUNK_SIZE + 1):
+            for cx in range(x // CHUNK_SIZE, (x + width - 1) // CHUNK_SIZE + 1):
+                self._label_chunk(cx, cy)
+        self._link()
+
+    def reachable(self, start, goal):
+        w = self.width
+        if not (0 <= start[0] < w and 0 <= start[1] < self.height and 0 <= goal[0] < w and 0 <= goal[1] < self.height):
+            return False
+        a = self.regions[start[1]*w + start[0]]
+        b = self.regions[goal[1]*w + goal[0]]
+        roots = self.roots
+        return a != 0 and b != 0 and roots.get(a, a) == roots.get(b, b)
+
+    def tile_path(self, start, goal):
+        """A* over walkable tiles from (x, y) to (x, y). Returns flat tile indices, or [] if unreachable."""
+        if not self.reachable(start, goal):
+            return []
+        w = self.width
+        walkable = self.walkable
+        s = start[1]*w + start[0]
+        t = goal[1]*w + goal[0]
+        gx, gy = goal
+        came_from = {s: -1}
+        g_score = {s: 0}
+        # Ties on f prefer the deeper node, which keeps the open set small on open floors
+        open_set = [(abs(start[0]-gx) + abs(start[1]-gy), 0, s)]
+        while open_set:
+            _, neg_g, i = heapq.heappop(open_set)
+            g = -neg_g
+            if i == t:
+                path = []
+                while i != -1:
+                    path.append(i)
+                    i = came_from[i]
+                return path[::-1]
+            if g > g_score[i]:
+                continue
+            x = i % w
+            ng = g + 1
+            for n in (i - w, i + w, i - 1 if x > 0 else -1, i + 1 if x < w - 1 else -1):
+                if n < 0 or n >= len(walkable) or not walkable[n]:
+                    continue
+                if ng < g_score.get(n, ng + 1):
+                    g_score[n] = ng
+                    came_from[n] = i
+                    nx, ny = n % w, n // w
+                    heapq.heappush(open_set, (ng + abs(nx-gx) + abs(ny-gy), -ng, n))
+        return []
+
+    def find_path(self, start, goal):
+        """Shortest (x, y, sx, sy) path from start to goal, including both ends; [] if unreachable."""
+        start = tuple(start)
+        goal = tuple(goal)
+        corridor = self.tile_path(start[:2], goal[:2])
+        if not corridor:
+            return []
+        # Subtiles inherit their tile's walkability, so the shortest subtile path is
+        # the subtile offset adjustment inside the start tile followed by the tile corridor.
+        x, y, sx, sy = start
+        path = [start]
+        while sx != goal[2]:
+            sx += 1 if goal[2] > sx else -1
+            path.append((x, y, sx, sy))
+        while sy != goal[3]:
+            sy += 1 if goal[3] > sy else -1
+            path.append((x, y, sx, sy))
+        w = self.width
+        for i in corridor[1:]:
+            path.append((i % w, i // w, sx, sy))
+        return path
+
+# Planners for maps passed to find_path directly, reused across calls while the map is alive
+_planners = weakref.WeakKeyDictionary()
+
+def get_planner(game_map):
+    planner = _planners.get(game_map)
+    if planner is None:
+        planner = _planners[game_map] = PathPlanner(game_map)
+    return planner
 
 def find_path(grid, start, goal):
-    def neighbors(pos):
-        x, y, sx, sy = pos
-        for dx, dy, dsx, dsy in [
-            (0, 0, 1, 0), (0, 0, -1, 0), (0, 0, 0, 1), (0, 0, 0, -1),
-            (1, 0, 0, 0), (-1, 0, 0, 0), (0, 1, 0, 0), (0, -1, 0, 0)
-        ]:
-            nx, ny, nsx, nsy = x+dx, y+dy, sx+dsx, sy+dsy
-            if 0 <= nx < len(grid[0]) and 0 <= ny < len(grid) and 0 <= nsx < SUBTILES_PER_TILE and 0 <= nsy < SUBTILES_PER_TILE:
-                if is_walkable_subtile(grid, nx, ny, nsx, nsy):
-                    yield (nx, ny, nsx, nsy)
-    def heuristic(a, b):
-        return abs(a[0]-b[0]) + abs(a[1]-b[1]) + abs(a[2]-b[2]) + abs(a[3]-b[3])
-    open_set = [(0, start)]
-    came_from = {}
-    g_score = {start: 0}
-    while open_set:
-        _, current = heapq.heappop(open_set)
-        if current == goal:
-            path = []
-            while current in came_from:
-                path.append(current)
-                current = came_from[current]
-            path.append(start)
-            return path[::-1]
-        for neighbor in neighbors(current):
-            tentative_g = g_score[current] + 1
-            if neighbor not in g_score or tentative_g < g_score[neighbor]:
-                came_from[neighbor] = current
-                g_score[neighbor] = tentative_g
-                heapq.heappush(open_set, (tentative_g + heuristic(neighbor, goal), neighbor))
-    return []
+    if not (0 <= goal[2] < SUBTILES_PER_TILE and 0 <= goal[3] < SUBTILES_PER_TILE):
+        return []
+    game_map = grid if isinstance(grid, GameMap) else GameMap.from_grid(grid)
+    return get_planner(game_map).find_path(start, goal)
@@ -0,0 +1,96 @@
+import time
+from collections import deque
+from shared.log import get_logger
+from shared.protocol import CODEC_JSON, MAX_PATH_STEPS, MOVE_STEPS_PER_SECOND, encode_message
+
+log = get_logger("client.prediction")
+
+STEP_INTERVAL = 1.0 / MOVE_STEPS_PER_SECOND
+
+# While walking a path the local player moves at once, at the server's walking
+# speed, instead of waiting for every step to be confirmed. state['prediction']
+# holds the walk:
+#   seq        sequence number of the last path sent
+#   trail      positions the server may still be at, oldest first; the last
+#              entry is the predicted position
+#   remaining  steps not yet taken locally
+#   next_step  monotonic time of the next local step
+# Server moves for the player are reconciled against it in reconcile().
+
+def start_path(state, path, send_queue, now=None):
+    """Send `path` (planned from the predicted position, which it starts with) and start walking it locally."""
+    if len(path) < 2:
+        return
+    # Longer walks stop at the server's limit; clicking again continues them
+    path = path[:MAX_PATH_STEPS + 1]
+    now = time.monotonic() if now is None else now
+    seq = state['path_seq'] = (state.get('path_seq', 0) + 1) & 0xFFFF
+    message = encode_message({
+        "type": "path",
+        "payload": {"seq": seq, "path": [list(step) for step in path]}
+    }, state.get('codec', CODEC_JSON))
+    if send_queue:
+        send_queue.put_nowait(message)
+    current = state.get('prediction')
+    # The server may still be anywhere along the current trail; it splices the new path in
+    trail = current["trail"] if current else [tuple(path[0])]
+    state['prediction'] = {
+        "seq": seq,
+        "trail": trail,
+        "remaining": deque(tuple(step) for step in path[1:]),
+        "next_step": now
+    }
+    advance_prediction(state, now)
+
+def advance_prediction(state, now=None):
+    """Take the local steps that are due."""
+    prediction = state.get('prediction')
+    if not prediction:
+        return
+    now = time.monotonic() if now is None else now
+    remaining = prediction["remaining"]
+    while remaining and now >= prediction["next_step"]:
+        step = remaining.popleft()
+        prediction["trail"].append(step)
+        state['player_pos'] = list(step)
+        prediction["next_step"] += STEP_INTERVAL
+    if not remaining:
+        # Don't bank time while waiting for the server to catch up
+        prediction["next_step"] = max(prediction["next_step"], now)
+
+def reconcile(state, pos):
+    """Apply a server position for the local player."""
+    prediction = state.get('prediction')
+    if not prediction:
+        state['player_pos'] = pos
+        return
+    server_pos = tuple(pos)
+    trail = prediction["trail"]
+    remaining = prediction["remaining"]
+    if server_pos in trail:
+        # The server is behind the prediction, as expected; forget what it has passed
+        del trail[:trail.index(server_pos)]
+    elif server_pos in remaining:
+        # The server is ahead (a slow frame locally); catch up
+        while remaining:
+            step = remaining.popleft()
+            if step == server_pos:
+                break
+        prediction["trail"] = [server_pos]
+        state['player_pos'] = pos
+    else:
+        log.debug("Prediction diverged: server at %s, trail %s", pos, trail)
+        state['player_pos'] = pos
+        state.pop('prediction', None)
+        return
+    if not remaining and len(prediction["trail"]) == 1:
+        state.pop('prediction', None)
+
+def apply_correction(state, payload):
+    """The server refused or cut short our path: snap to where it says we are."""
+    if payload.get('seq') != state.get('path_seq'):
+        # About an older path that has since been replaced
+        return
+    log.debug("Path %s corrected to %s", payload.get('seq'), payload.get('pos'))
+    state.pop('prediction', None)
+    state['player_pos'] = payload['pos']
@@ -0,0 +1,31 @@
+import os
+import uuid
+from core.mapcache import CACHE_DIR
+from shared.log import get_logger
+
+log = get_logger("client.net")
+
+PROFILE_PATH = os.path.join(CACHE_DIR, 'profile_id')
+
+def load_profile_id():
+    """Stable id the server saves this player's progress under, created on first run.
+
+    Set ISO_PROFILE to play as a different profile, e.g. to run several clients on one machine.
+    """
+    if os.environ.get('ISO_PROFILE'):
+        return os.environ['ISO_PROFILE']
+    try:
+        with open(PROFILE_PATH, 'r') as f:
+            profile_id = f.read().strip()
+        if profile_id:
+            return profile_id
+    except OSError:
+        pass
+    profile_id = str(uuid.uuid4())
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(PROFILE_PATH, 'w') as f:
+            f.write(profile_id)
+    except OSError as e:
+        log.warning("Could not save profile id: %s", e)
+    return profile_id
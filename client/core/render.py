@@ -1,33 +1,38 @@
 import pygame
 import math
-from .sprites import draw_sprite
+from .sprites import draw_sprite, sprite_surface
+
+# Tile sprite name by map cell value, with the sprite used when the tileset lacks it
+TILE_SPRITES = {0: ("floor", "floor"), 1: ("wall", "wall"), 2: ("exit", "exit"), 3: ("waypoint", "exit"), 4: ("event", "floor")}
 
 def draw_isometric_grid(screen, map_grid, map_height, map_width, SPRITE_PALETTE, SPRITE_TILES, TILE_WIDTH, TILE_HEIGHT, zoom):
     if not map_grid or not SPRITE_PALETTE or not SPRITE_TILES:
         return
+    # Resolve each tile type to its rasterized surface once per frame, then blit the whole layer in one call
+    surfaces = {
+        tile: sprite_surface(SPRITE_TILES.get(name, SPRITE_TILES[fallback]), SPRITE_PALETTE, 4, zoom)
+        for tile, (name, fallback) in TILE_SPRITES.items()
+    }
+    floor = surfaces[0]
+    screen_w = screen.get_width()
+    screen_h = screen.get_height()
+    half_w = TILE_WIDTH // 2
+    half_h = TILE_HEIGHT // 2
+    origin_x = (1-zoom)*screen_w//2
+    origin_y = (1-zoom)*screen_h//2
+    batch = []
+    append = batch.append
     for y in range(map_height):
+        row = map_grid[y]
         for x in range(map_width):
-            tile = map_grid[y][x]
-            sx = int(((x - y) * (TILE_WIDTH // 2) + screen.get_width() // 2) * zoom + (1-zoom)*screen.get_width()//2)
-            sy = int(((x + y) * (TILE_HEIGHT // 2) + 50) * zoom + (1-zoom)*screen.get_height()//2)
-            # Choose sprite by tile type
-            if tile == 0:
-                sprite = SPRITE_TILES["floor"]
-            elif tile == 1:
-                sprite = SPRITE_TILES["wall"]
-            elif tile == 2:
-                sprite = SPRITE_TILES["exit"]
-            elif tile == 3:
-                sprite = SPRITE_TILES.get("waypoint", SPRITE_TILES["exit"])
-            elif tile == 4:
-                sprite = SPRITE_TILES.get("event", SPRITE_TILES["floor"])
-            else:
-                sprite = SPRITE_TILES["floor"]
-            draw_sprite(screen, sprite, SPRITE_PALETTE, sx, sy, 4)
+            sx = int(((x - y) * half_w + screen_w // 2) * zoom + origin_x)
+            sy = int(((x + y) * half_h + 50) * zoom + origin_y)
+            append((surfaces.get(row[x], floor), (sx, sy)))
+    screen.blits(batch, doreturn=False)
 
 def draw_player(screen, pos, player_class, SPRITE_PALETTE, SPRITE_CHARACTERS, TILE_WIDTH, TILE_HEIGHT, zoom):
     if not player_class:
-        return  # Don't draw if class is not set
+        return None  # Don't draw if class is not set
     x, y, sx, sy = pos
     offset_x = (sx - 1) * (TILE_WIDTH // 6)
     offset_y = (sy - 1) * (TILE_HEIGHT // 6)
@@ -35,6 +40,15 @@ def draw_player(screen, pos, player_class, SPRITE_PALETTE, SPRITE_CHARACTERS, TI
     sy_iso = int(((x + y) * (TILE_HEIGHT // 2) + 50) * zoom + (1-zoom)*screen.get_height()//2 + TILE_HEIGHT//2*zoom + offset_y)
     if SPRITE_PALETTE and SPRITE_CHARACTERS:
         sprite = SPRITE_CHARACTERS.get(player_class.lower(), SPRITE_CHARACTERS["brute"])
-        draw_sprite(screen, sprite, SPRITE_PALETTE, sx_iso-16, sy_iso-16, 4)
+        return draw_sprite(screen, sprite, SPRITE_PALETTE, sx_iso-int(16*zoom), sy_iso-int(16*zoom), 4, zoom)
+    else:
+        return pygame.draw.circle(screen, (255, 100, 100), (sx_iso, sy_iso), int(12*zoom))
+
+def draw_monster(screen, pos, monster_type, SPRITE_PALETTE, SPRITE_MONSTERS, TILE_WIDTH, TILE_HEIGHT, zoom):
+    x, y = pos
+    sx_iso = int(((x - y) * (TILE_WIDTH // 2) + screen.get_width() // 2) * zoom + (1-zoom)*screen.get_width()//2 + TILE_WIDTH//2*zoom)
+    sy_iso = int(((x + y) * (TILE_HEIGHT // 2) + 50) * zoom + (1-zoom)*screen.get_height()//2 + TILE_HEIGHT//2*zoom)
+    if SPRITE_PALETTE and SPRITE_MONSTERS and monster_type in SPRITE_MONSTERS:
+        return draw_sprite(screen, SPRITE_MONSTERS[monster_type], SPRITE_PALETTE, sx_iso-int(16*zoom), sy_iso-int(16*zoom), 4, zoom)
     else:
-        pygame.draw.circle(screen, (255, 100, 100), (sx_iso, sy_iso), int(12*zoom))
+        return pygame.draw.circle(screen, (100, 255, 100), (sx_iso, sy_iso), int(10*zoom))
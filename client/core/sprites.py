@@ -1,6 +1,7 @@
 import pygame
 import json
 import os
+from collections import OrderedDict
 
 def load_sprites(SPRITE_PATH):
     with open(SPRITE_PATH, 'r') as f:
@@ -23,12 +24,45 @@ def load_sprites(SPRITE_PATH):
     ]
     return palette, data["tiles"], data["characters"], data["monsters"], data["boss"]
 
-def draw_sprite(screen, sprite, palette, x, y, scale):
+# Rasterized sprites kept for reuse; enough for every sprite at a few zoom levels
+SPRITE_CACHE_SIZE = 256
+
+# (id(sprite), id(palette), scale, zoom) -> (sprite, palette, surface); least recently used first.
+# The sprite and palette are kept alive with their surface so their ids can't be reused.
+_surfaces = OrderedDict()
+
+def sprite_surface(sprite, palette, scale, zoom=1.0):
+    """The sprite rasterized once into a per-pixel alpha surface, each sprite pixel scale*zoom screen pixels wide."""
+    key = (id(sprite), id(palette), scale, zoom)
+    entry = _surfaces.get(key)
+    if entry is not None:
+        _surfaces.move_to_end(key)
+        return entry[2]
+    width = max((len(row) for row in sprite), default=0)
+    surface = pygame.Surface((width*scale, len(sprite)*scale), pygame.SRCALPHA)
     for row in range(len(sprite)):
         for col in range(len(sprite[row])):
             color_idx = sprite[row][col]
             if color_idx == 0:
                 continue  # transparent
-            color = palette[color_idx]
-            rect = pygame.Rect(x + col*scale, y + row*scale, scale, scale)
-            pygame.draw.rect(screen, color, rect)
+            surface.fill(palette[color_idx], (col*scale, row*scale, scale, scale))
+    if zoom != 1.0:
+        size = (max(1, round(surface.get_width()*zoom)), max(1, round(surface.get_height()*zoom)))
+        surface = pygame.transform.scale(surface, size)
+    if pygame.display.get_surface() is not None:
+        # Match the display's pixel format so blits don't convert every frame
+        surface = surface.convert_alpha()
+    _surfaces[key] = (sprite, palette, surface)
+    if len(_surfaces) > SPRITE_CACHE_SIZE:
+        _surfaces.popitem(last=False)
+    return surface
+
+def preload_sprite_surface(sprite, palette, scale, surface, zoom=1.0):
+    """Install an already rasterized surface for the sprite, e.g. a region of a baked atlas."""
+    _surfaces[(id(sprite), id(palette), scale, zoom)] = (sprite, palette, surface)
+    _surfaces.move_to_end((id(sprite), id(palette), scale, zoom))
+    if len(_surfaces) > SPRITE_CACHE_SIZE:
+        _surfaces.popitem(last=False)
+
+def draw_sprite(screen, sprite, palette, x, y, scale, zoom=1.0):
+    return screen.blit(sprite_surface(sprite, palette, scale, zoom), (x, y))
@@ -0,0 +1,147 @@
+import math
+import pygame
+from collections import OrderedDict
+from .render import TILE_SPRITES
+from .sprites import sprite_surface
+
+# Tiles per chunk side. An 8x8 chunk is a diamond of about 480x256 pixels at zoom 1.
+CHUNK_TILES = 8
+# Chunk surfaces kept across frames (about 0.5 MB each at zoom 1); never fewer than twice the visible set
+CHUNK_CACHE_SIZE = 64
+# Transparent colour of chunk surfaces; colour-keyed blits are cheaper than per-pixel alpha
+CHUNK_COLORKEY = (255, 0, 255)
+
+class TerrainLayer:
+    """The static tiles of one map at one zoom level, pre-rendered into chunk surfaces.
+
+    Tiles are drawn into off-screen chunk surfaces the first time a chunk
+    comes into view and reused after that, until invalidate() reports tiles
+    under them changed (a streamed map chunk arriving). draw() only visits
+    chunks that can overlap the screen, so the cost of a frame depends on the
+    screen size rather than the map size. Positions match
+    draw_isometric_grid exactly.
+    """
+
+    def __init__(self, map_grid, map_width, map_height, palette, tiles, tile_width, tile_height, zoom, screen_size):
+        self.grid = map_grid
+        self.width = map_width
+        self.height = map_height
+        self.zoom = zoom
+        self.screen_size = screen_size
+        self.surfaces = {
+            tile: sprite_surface(tiles.get(name, tiles[fallback]), palette, 4, zoom)
+            for tile, (name, fallback) in TILE_SPRITES.items()
+        }
+        self.sprite_w = max(s.get_width() for s in self.surfaces.values())
+        self.sprite_h = max(s.get_height() for s in self.surfaces.values())
+        # Screen position of tile (x, y) is origin + ((x - y) * step_x, (x + y) * step_y)
+        screen_w, screen_h = screen_size
+        self.step_x = (tile_width // 2) * zoom
+        self.step_y = (tile_height // 2) * zoom
+        self.origin_x = (screen_w // 2) * zoom + (1-zoom)*screen_w//2
+        self.origin_y = 50 * zoom + (1-zoom)*screen_h//2
+        # (cx, cy) -> (surface, screen position); least recently drawn first
+        self.chunks = OrderedDict()
+        self.chunks_rendered = 0
+        # Bumped when cached chunks are dropped by invalidate(), so backdrops built from them are redrawn
+        self.revision = 0
+
+    def _chunk_bounds(self, cx, cy):
+        x0, y0 = cx * CHUNK_TILES, cy * CHUNK_TILES
+        x1 = min(self.width, x0 + CHUNK_TILES) - 1
+        y1 = min(self.height, y0 + CHUNK_TILES) - 1
+        return x0, y0, x1, y1
+
+    def _render_chunk(self, cx, cy):
+        x0, y0, x1, y1 = self._chunk_bounds(cx, cy)
+        # Offsets of the chunk's top-left corner from the map origin
+        left = (x0 - y1) * self.step_x
+        top = (x0 + y0) * self.step_y
+        size = (int(math.ceil((x1 - y0) * self.step_x - left)) + self.sprite_w,
+                int(math.ceil((x1 + y1) * self.step_y - top)) + self.sprite_h)
+        surface = pygame.Surface(size)
+        surface.fill(CHUNK_COLORKEY)
+        surface.set_colorkey(CHUNK_COLORKEY, pygame.RLEACCEL)
+        floor = self.surfaces[0]
+        batch = []
+        for y in range(y0, y1 + 1):
+            row = self.grid[y]
+            for x in range(x0, x1 + 1):
+                batch.append((self.surfaces.get(row[x], floor),
+                              (int((x - y) * self.step_x - left), int((x + y) * self.step_y - top))))
+        surface.blits(batch, doreturn=False)
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert()
+        self.chunks_rendered += 1
+        return surface, (int(self.origin_x + left), int(self.origin_y + top))
+
+    def visible_chunks(self, viewport):
+        """Chunk indices whose surfaces overlap `viewport` (a screen Rect)."""
+        # Tiles whose sprite can touch the viewport, as ranges of x - y and x + y
+        u0 = (viewport.left - self.sprite_w - self.origin_x) / self.step_x
+        u1 = (viewport.right - self.origin_x) / self.step_x
+        v0 = (viewport.top - self.sprite_h - self.origin_y) / self.step_y
+        v1 = (viewport.bottom - self.origin_y) / self.step_y
+        tx0 = max(0, math.floor((u0 + v0) / 2))
+        tx1 = min(self.width - 1, math.ceil((u1 + v1) / 2))
+        ty0 = max(0, math.floor((v0 - u1) / 2))
+        ty1 = min(self.height - 1, math.ceil((v1 - u0) / 2))
+        if tx0 > tx1 or ty0 > ty1:
+            return []
+        visible = []
+        for cy in range(ty0 // CHUNK_TILES, ty1 // CHUNK_TILES + 1):
+            for cx in range(tx0 // CHUNK_TILES, tx1 // CHUNK_TILES + 1):
+                x0, y0, x1, y1 = self._chunk_bounds(cx, cy)
+                rect = pygame.Rect(
+                    int(self.origin_x + (x0 - y1) * self.step_x), int(self.origin_y + (x0 + y0) * self.step_y),
+                    int((x1 - y0 - x0 + y1) * self.step_x) + self.sprite_w, int((x1 + y1 - x0 - y0) * self.step_y) + self.sprite_h
+                )
+                if rect.colliderect(viewport):
+                    visible.append((cx, cy))
+        return visible
+
+    def invalidate(self, x, y, width, height):
+        """Drop the cached chunks covering a rectangle of tiles whose contents changed."""
+        dropped = False
+        for cy in range(y // CHUNK_TILES, (y + height - 1) // CHUNK_TILES + 1):
+            for cx in range(x // CHUNK_TILES, (x + width - 1) // CHUNK_TILES + 1):
+                dropped = self.chunks.pop((cx, cy), None) is not None or dropped
+        if dropped:
+            self.revision += 1
+
+    def draw(self, screen, viewport=None):
+        """Blit the chunks overlapping the viewport (the whole screen by default)."""
+        viewport = viewport or screen.get_rect()
+        visible = self.visible_chunks(viewport)
+        chunks = self.chunks
+        batch = []
+        for key in visible:
+            chunk = chunks.get(key)
+            if chunk is None:
+                chunk = chunks[key] = self._render_chunk(*key)
+            else:
+                chunks.move_to_end(key)
+            batch.append(chunk)
+        screen.blits(batch, doreturn=False)
+        limit = max(CHUNK_CACHE_SIZE, 2 * len(visible))
+        while len(chunks) > limit:
+            chunks.popitem(last=False)
+
+def get_terrain(state, assets, screen):
+    """The terrain layer for the current map, zoom and screen size, built when any of them changes."""
+    key = (id(state['map_grid']), state['map_width'], state['map_height'], state['zoom'], screen.get_size())
+    terrain = state.get('terrain')
+    if terrain is None or terrain[0] != key:
+        layer = TerrainLayer(
+            state['map_grid'], state['map_width'], state['map_height'],
+            assets['SPRITE_PALETTE'], assets['SPRITE_TILES'], assets['TILE_WIDTH'], assets['TILE_HEIGHT'],
+            state['zoom'], screen.get_size()
+        )
+        terrain = state['terrain'] = (key, layer)
+    # Tile rects changed in place since the last frame, e.g. by map chunks streaming in
+    dirty = state.get('map_dirty')
+    if dirty:
+        for rect in dirty:
+            terrain[1].invalidate(*rect)
+        dirty.clear()
+    return terrain[1]
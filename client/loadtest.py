@@ -0,0 +1,247 @@
+"""
+Headless bot swarm for load testing a running server.
+
+Each bot is an asyncio session speaking the same protocol as the game client:
+it sends class_select, joins a party, then walks the map one step at a time,
+waiting for the server to confirm each step before thinking and moving again.
+In click mode bots instead send whole paths and walk them with the client's
+prediction, the way a player clicking on the map does. Server messages are
+applied with the client's own handlers, and paths come from the client's path
+planner.
+
+    python server/main.py --allow-zone-select
+    python client/loadtest.py --bots 500 --scenario spread --mode path
+
+Scenarios other than one-party ask for a specific act/zone in class_select,
+which the server only honours when started with --allow-zone-select.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+import websockets
+from core.network import handle_message, map_planner
+from core.prediction import STEP_INTERVAL, advance_prediction, start_path
+from shared.log import get_logger, setup_logging
+from shared.protocol import SUPPORTED_CODECS, decode_message, encode_message
+
+log = get_logger("client.loadtest")
+
+CLASSES = ["Brute", "Scout", "Savant", "Vanguard"]
+SCENARIOS = ("one-party", "spread", "endgame")
+MODES = ("walk", "path", "click")
+# Seconds to wait for the welcome (and map) and for a move to be confirmed
+JOIN_TIMEOUT = 10.0
+MOVE_TIMEOUT = 2.0
+
+def scenario_progress(scenario, index):
+    """Act/zone fields for bot `index` under a scenario."""
+    if scenario == "spread":
+        # Round-robin over the 30 campaign zones
+        return {"act": index // 10 % 3 + 1, "zone": index % 10 + 1}
+    if scenario == "endgame":
+        return {"act": 4, "zone": 1, "endgame_depth": index % 10 + 1}
+    return {}
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+class SwarmStats:
+    def __init__(self):
+        self.connect = []
+        self.rtt = []
+        self.sent = 0
+        self.received = 0
+        self.moves = 0
+        self.errors = Counter()
+        self.connected = 0
+
+    def report(self, elapsed):
+        lines = [f"bots connected: {self.connected}, elapsed {elapsed:.1f}s"]
+        for name, values in (("connect", self.connect), ("move rtt", self.rtt)):
+            values = sorted(values)
+            lines.append(
+                f"{name:9s} n={len(values):7d}  "
+                + "  ".join(f"p{q*100:g}={percentile(values, q)*1000:7.1f}ms" for q in (0.5, 0.9, 0.99, 0.999))
+            )
+        lines.append(f"messages: sent {self.sent / elapsed:.0f}/s, received {self.received / elapsed:.0f}/s")
+        attempts = self.moves + len(self.connect) + self.errors["connect"]
+        total_errors = sum(self.errors.values())
+        lines.append(f"errors: {total_errors} ({100.0 * total_errors / max(1, attempts):.2f}% of operations) {dict(self.errors)}")
+        return "\n".join(lines)
+
+def next_walk_step(state, rng):
+    """A random walkable neighbouring tile, keeping the current subtile."""
+    x, y, sx, sy = state['player_pos']
+    game_map = state['game_map']
+    options = [
+        (nx, ny) for nx, ny in ((x, y-1), (x, y+1), (x-1, y), (x+1, y))
+        if 0 <= nx < game_map.width and 0 <= ny < game_map.height and game_map.walkable[ny*game_map.stride + nx]
+    ]
+    if not options:
+        return None
+    nx, ny = rng.choice(options)
+    return [nx, ny, sx, sy]
+
+def next_path_step(state, rng):
+    """The next step towards a random destination, planning a new path when the last one is used up."""
+    path = state.get('bot_path')
+    if not path:
+        game_map = state['game_map']
+        gx, gy = game_map.random_walkable_cell(rng)
+        path = state['bot_path'] = map_planner(state).find_path(state['player_pos'], (gx, gy, 1, 1))[1:]
+        if not path:
+            return None
+    return list(path.pop(0))
+
+async def walk_path(websocket, state, stats, rng):
+    """Click somewhere random and walk there, returning once the server has confirmed the whole path."""
+    game_map = state['game_map']
+    gx, gy = game_map.random_walkable_cell(rng)
+    path = map_planner(state).find_path(tuple(state['player_pos']), (gx, gy, 1, 1))
+    if len(path) < 2:
+        return
+    outbox = asyncio.Queue()
+    start_path(state, path, outbox)
+    await websocket.send(outbox.get_nowait())
+    sent = time.perf_counter()
+    stats.sent += 1
+    stats.moves += 1
+    walk_time = (len(path) - 2) * STEP_INTERVAL
+    deadline = sent + walk_time + MOVE_TIMEOUT
+    while state.get('prediction') and time.perf_counter() < deadline:
+        advance_prediction(state)
+        await asyncio.sleep(STEP_INTERVAL / 2)
+    if state.get('prediction'):
+        stats.errors["path_timeout"] += 1
+        state.pop('prediction', None)
+    else:
+        # Confirmation lag beyond the time the walk itself takes
+        stats.rtt.append(max(0.0, time.perf_counter() - sent - walk_time))
+
+async def read_loop(websocket, state, stats, acked):
+    """Apply server messages and signal when the pending move has been confirmed."""
+    async for message in websocket:
+        stats.received += 1
+        data = decode_message(message)
+        await handle_message(websocket, state, data)
+        if data.get('type') == 'correction':
+            stats.errors["correction"] += 1
+        pending = state.get('pending_move')
+        if data.get('type') == 'welcome':
+            # The move took us through an exit into the next zone
+            state['bot_path'] = None
+        if pending and (data.get('type') == 'welcome' or list(state['player_pos']) == pending[0]):
+            stats.rtt.append(time.perf_counter() - pending[1])
+            state['pending_move'] = None
+            acked.set()
+
+async def run_bot(index, args, stats, deadline):
+    rng = random.Random(args.seed * 100003 + index)
+    state = {}
+    codecs = [args.codec] if args.codec else list(SUPPORTED_CODECS)
+    started = time.perf_counter()
+    try:
+        websocket = await websockets.connect(args.uri, max_size=None)
+    except (OSError, websockets.WebSocketException) as e:
+        stats.errors["connect"] += 1
+        log.debug("Bot %d could not connect: %s", index, e)
+        return
+    try:
+        await websocket.send(json.dumps({
+            "type": "class_select",
+            "payload": {
+                "class": rng.choice(CLASSES), "codecs": codecs, "profile_id": f"bot-{args.seed}-{index}",
+                **scenario_progress(args.scenario, index)
+            }
+        }))
+        stats.sent += 1
+        while state.get('game_map') is None:
+            message = await asyncio.wait_for(websocket.recv(), JOIN_TIMEOUT)
+            stats.received += 1
+            await handle_message(websocket, state, decode_message(message))
+        stats.connect.append(time.perf_counter() - started)
+        stats.connected += 1
+        acked = asyncio.Event()
+        reader = asyncio.create_task(read_loop(websocket, state, stats, acked))
+        try:
+            while time.monotonic() < deadline and not reader.done():
+                step = None
+                if args.mode == "click" and state.get('game_map') is not None:
+                    await walk_path(websocket, state, stats, rng)
+                elif state.get('game_map') is not None:
+                    step = next_path_step(state, rng) if args.mode == "path" else next_walk_step(state, rng)
+                if step is not None:
+                    acked.clear()
+                    state['pending_move'] = (step, time.perf_counter())
+                    await websocket.send(encode_message({"type": "move", "payload": {"pos": step}}, state['codec']))
+                    stats.sent += 1
+                    stats.moves += 1
+                    try:
+                        await asyncio.wait_for(acked.wait(), MOVE_TIMEOUT)
+                    except asyncio.TimeoutError:
+                        stats.errors["move_timeout"] += 1
+                        state['pending_move'] = None
+                        state['bot_path'] = None
+                if args.think > 0:
+                    await asyncio.sleep(args.think * rng.uniform(0.5, 1.5))
+            if reader.done() and reader.exception():
+                raise reader.exception()
+        finally:
+            reader.cancel()
+    except asyncio.TimeoutError:
+        stats.errors["join_timeout"] += 1
+    except websockets.ConnectionClosed:
+        stats.errors["closed"] += 1
+    except ValueError as e:
+        stats.errors["protocol"] += 1
+        log.debug("Bot %d protocol error: %s", index, e)
+    finally:
+        await websocket.close()
+
+async def fetch_server_stats(uri):
+    async with websockets.connect(uri, max_size=None) as websocket:
+        await websocket.send(json.dumps({"type": "stats"}))
+        return json.loads(await websocket.recv())["payload"]
+
+async def main():
+    parser = argparse.ArgumentParser(description="Headless bot swarm load tester")
+    parser.add_argument("--uri", default="ws://localhost:8765")
+    parser.add_argument("--bots", type=int, default=100)
+    parser.add_argument("--scenario", choices=SCENARIOS, default="one-party")
+    parser.add_argument("--mode", choices=MODES, default="walk", help="random tile walk, click-to-move paths sent step by step, or whole paths with prediction")
+    parser.add_argument("--think", type=float, default=0.2, help="mean seconds between moves")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to keep bots moving")
+    parser.add_argument("--ramp", type=float, default=200.0, help="new connections per second")
+    parser.add_argument("--codec", choices=SUPPORTED_CODECS, default=None, help="force a wire codec")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--server-stats", action="store_true", help="print the server's latency histograms afterwards")
+    args = parser.parse_args()
+    setup_logging("client")
+    stats = SwarmStats()
+    started = time.monotonic()
+    deadline = started + args.bots / args.ramp + args.duration
+    bots = []
+    for i in range(args.bots):
+        bots.append(asyncio.create_task(run_bot(i, args, stats, deadline)))
+        await asyncio.sleep(1.0 / args.ramp)
+    await asyncio.gather(*bots)
+    print(stats.report(time.monotonic() - started))
+    if args.server_stats:
+        server = await fetch_server_stats(args.uri)
+        print(json.dumps({"gauges": server.get("gauges"), "histograms_us": server.get("histograms_us")}, indent=2))
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -4,19 +4,26 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 import asyncio
 import pygame
-from core.sprites import load_sprites
+from core.atlas import load_sprite_bundle
+from core.interpolation import SnapshotBuffer
 from core.network import network_loop
 from core.pathfinding import find_path
 from core.game import draw_game, draw_main_menu, draw_character_select
 from core.input import handle_input, handle_main_menu_input, handle_character_select_input
 from core.update import update_game
+from core.profile import load_profile_id
+from shared.log import setup_logging
+from shared.protocol import SUPPORTED_CODECS
+
+# Frame rate cap
+FPS = 60
 
 async def game_loop(state, assets, send_queue, recv_queue):
     import pygame
-    screen = pygame.display.set_mode((800, 600))
-    pygame.display.set_caption("Isometric Roguelike Client")
+    screen = pygame.display.get_surface()
     clock = pygame.time.Clock()
     running = True
+    last_scene = None
     while running:
         for event in pygame.event.get():
             if state['scene'] == 'main_menu':
@@ -27,16 +34,24 @@ async def game_loop(state, assets, send_queue, recv_queue):
                 running = handle_input(event, state, send_queue)
             if not running:
                 break
+        if state['scene'] != last_scene:
+            # Menus draw over the whole screen; start the game scene from a full redraw
+            state.pop('frame', None)
+            last_scene = state['scene']
+        dirty = None
         if state['scene'] == 'main_menu':
             draw_main_menu(screen)
         elif state['scene'] == 'character_select':
             draw_character_select(screen, state.get('selected_class'))
         elif state['scene'] == 'game':
             update_game(state, send_queue)
-            screen.fill((30, 30, 30))
-            draw_game(screen, state, assets)
-        pygame.display.flip()
-        clock.tick(30)
+            dirty = draw_game(screen, state, assets)
+        if dirty is None:
+            pygame.display.flip()
+        else:
+            # Only push the areas that changed this frame
+            pygame.display.update(dirty)
+        clock.tick(FPS)
         await asyncio.sleep(0)  # Yield to event loop for network
     pygame.quit()
     sys.exit()
@@ -53,15 +68,25 @@ async def main():
         'map_height': 0,
         'zoom': 1.0,
         'in_city': False,
+        # Wire codecs offered to the server; set ISO_CODEC=json to force readable frames for debugging
+        'codecs': [os.environ['ISO_CODEC']] if os.environ.get('ISO_CODEC') else list(SUPPORTED_CODECS),
+        # Server positions of other players and monsters, replaced on each welcome
+        'snapshots': SnapshotBuffer(),
+        # Progress is saved on the server under this id
+        'profile_id': load_profile_id(),
         # ...add more state as needed...
     }
     assets = {
         'TILE_WIDTH': 64,
         'TILE_HEIGHT': 32,
     }
+    setup_logging("client")
     pygame.init()
+    # Open the window first so the sprite atlas is loaded straight into the display format
+    pygame.display.set_mode((800, 600))
+    pygame.display.set_caption("Isometric Roguelike Client")
     SPRITE_PATH = os.path.join(os.path.dirname(__file__), '../assets/sprites_palette.json')
-    palette, tiles, chars, monsters, boss = load_sprites(SPRITE_PATH)
+    palette, tiles, chars, monsters, boss = load_sprite_bundle(SPRITE_PATH)
     assets['SPRITE_PALETTE'] = palette
     assets['SPRITE_TILES'] = tiles
     assets['SPRITE_CHARACTERS'] = chars
@@ -0,0 +1,67 @@
+# Area-of-interest tracking for party instances
+
+# Tiles around a player within which other entities are replicated to it
+INTEREST_RADIUS = 16
+# Side length, in tiles, of one spatial hash bucket
+AOI_CELL_SIZE = 8
+
+class SpatialHash:
+    """Uniform grid over tile coordinates mapping buckets to the entity ids inside them.
+
+    Moves only touch the hash when an entity crosses a bucket boundary, and a
+    radius query visits the buckets overlapping the query square rather than
+    every entity in the party.
+    """
+
+    def __init__(self, cell_size=AOI_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.positions = {}
+
+    def _cell(self, x, y):
+        return (x // self.cell_size, y // self.cell_size)
+
+    def insert(self, eid, x, y):
+        self.positions[eid] = (x, y)
+        self.cells.setdefault(self._cell(x, y), set()).add(eid)
+
+    def move(self, eid, x, y):
+        old = self.positions.get(eid)
+        if old is None:
+            self.insert(eid, x, y)
+            return
+        self.positions[eid] = (x, y)
+        old_cell = self._cell(*old)
+        new_cell = self._cell(x, y)
+        if old_cell != new_cell:
+            self._discard(old_cell, eid)
+            self.cells.setdefault(new_cell, set()).add(eid)
+
+    def remove(self, eid):
+        old = self.positions.pop(eid, None)
+        if old is not None:
+            self._discard(self._cell(*old), eid)
+
+    def _discard(self, cell, eid):
+        bucket = self.cells.get(cell)
+        if bucket is not None:
+            bucket.discard(eid)
+            if not bucket:
+                del self.cells[cell]
+
+    def query(self, x, y, radius=INTEREST_RADIUS):
+        """Return the set of entity ids within `radius` tiles (Chebyshev distance) of (x, y)."""
+        found = set()
+        positions = self.positions
+        cx0, cy0 = self._cell(x - radius, y - radius)
+        cx1, cy1 = self._cell(x + radius, y + radius)
+        for cy in range(cy0, cy1 + 1):
+            for cx in range(cx0, cx1 + 1):
+                bucket = self.cells.get((cx, cy))
+                if not bucket:
+                    continue
+                for eid in bucket:
+                    ex, ey = positions[eid]
+                    if abs(ex - x) <= radius and abs(ey - y) <= radius:
+                        found.add(eid)
+        return found
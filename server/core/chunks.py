@@ -0,0 +1,81 @@
+import json
+from itertools import islice
+from shared.log import get_logger
+from shared.map import chunk_of, pack_cells
+
+log = get_logger("server.chunks")
+
+# Chunks kept streamed around the player's own chunk (1 = the surrounding 3x3 block)
+STREAM_RADIUS = 1
+# Steps of a walk looked ahead to send chunks before the player reaches them
+PREFETCH_STEPS = 64
+# Most chunks one chunk_request may ask for
+MAX_CHUNK_REQUEST = 64
+
+def chunk_message(party, cx, cy):
+    """(version, JSON map_chunk message) for a chunk, packed once per chunk version."""
+    game_map = party["map"]
+    version = game_map.chunk_versions[cy * game_map.chunks_x + cx]
+    packed = party["chunk_packed"].get((cx, cy))
+    if packed is None or packed[0] != version:
+        x, y, w, h = game_map.chunk_bounds(cx, cy)
+        packed = party["chunk_packed"][(cx, cy)] = (version, json.dumps({
+            "type": "map_chunk",
+            "payload": {
+                "hash": party["map_hash"],
+                "cx": cx,
+                "cy": cy,
+                "version": version,
+                "width": w,
+                "height": h,
+                "encoding": "zlib+base64",
+                "data": pack_cells(game_map.chunk_cells(cx, cy))
+            }
+        }))
+    return packed
+
+def wanted_chunks(state, client_id, party):
+    """Chunks a streaming client should have: the block around its chunk, and the chunks its walk is heading into."""
+    game_map = party["map"]
+    x, y = state['entities'].tile(state['entity_ids'][client_id])
+    centres = [chunk_of(x, y)]
+    walk = party["walks"].get(client_id)
+    if walk:
+        for step in islice(walk["steps"], PREFETCH_STEPS):
+            ahead = chunk_of(step[0], step[1])
+            if ahead != centres[-1]:
+                centres.append(ahead)
+    wanted = set()
+    r = STREAM_RADIUS
+    for cx, cy in centres[:1] + centres[-1:]:
+        wanted.update((cx + dx, cy + dy) for dy in range(-r, r + 1) for dx in range(-r, r + 1))
+    # The chunks along the way, without their surroundings
+    wanted.update(centres)
+    return [(cx, cy) for cx, cy in wanted if 0 <= cx < game_map.chunks_x and 0 <= cy < game_map.chunks_y]
+
+def send_chunks(state, client_id, party, chunks, resend=False):
+    """Send the chunks the client doesn't have at their current version (all of them with resend), nearest first."""
+    out = state['outbound'].get(client_id)
+    if not out:
+        return
+    game_map = party["map"]
+    sent = party["chunk_streams"].setdefault(client_id, {})
+    pcx, pcy = chunk_of(*state['entities'].tile(state['entity_ids'][client_id]))
+    counter = state['metrics'].counter("map_chunks_sent")
+    for cx, cy in sorted(chunks, key=lambda c: max(abs(c[0] - pcx), abs(c[1] - pcy))):
+        if not (0 <= cx < game_map.chunks_x and 0 <= cy < game_map.chunks_y):
+            continue
+        version, message = chunk_message(party, cx, cy)
+        if resend or sent.get((cx, cy)) != version:
+            out.send(message)
+            sent[(cx, cy)] = version
+            counter.inc()
+
+def stream_chunks(state, party_id, moves):
+    """After a tick's moves, send streaming clients the chunks they are moving towards."""
+    party = state['parties'][party_id]
+    streams = party["chunk_streams"]
+    for move in moves:
+        client_id = move.get("client_id")
+        if client_id in streams:
+            send_chunks(state, client_id, party, wanted_chunks(state, client_id, party))
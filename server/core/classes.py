@@ -12,4 +12,10 @@ CLASS_MAIN_STAT = {
     "Vanguard": None
 }
 
+# Small integer ids for the entity store's class component
+CLASS_NAMES = tuple(CLASSES)
+CLASS_IDS = {name: i for i, name in enumerate(CLASS_NAMES)}
+
+PLAYER_BASE_HP = 100
+
 # ...move more class/stat logic here as needed...
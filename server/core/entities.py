@@ -0,0 +1,99 @@
+from array import array
+from collections import deque
+
+KIND_PLAYER = 1
+KIND_MONSTER = 2
+
+# Freed ids are only reused once this many are waiting, so clients have long
+# since received the removal before an id comes back for a different entity
+FREE_ID_RESERVE = 1024
+# Entity ids go on the wire as unsigned 16-bit integers
+MAX_ENTITY_ID = 0xFFFF
+
+class EntityStore:
+    """Struct-of-arrays component store for players and monsters.
+
+    Each component is a typed array indexed by a dense slot, so tick systems can
+    sweep live entities without per-entity dicts. Entity ids (also the wire ids)
+    map to slots through a sparse array; removal moves the last slot into the
+    hole, keeping add and remove O(1) and the arrays packed.
+    """
+
+    def __init__(self):
+        # Dense components, indexed by slot
+        self.ids = array('H')
+        self.kind = array('B')
+        self.x = array('H')
+        self.y = array('H')
+        self.sx = array('B')
+        self.sy = array('B')
+        self.hp = array('h')
+        self.max_hp = array('h')
+        self.type_id = array('B')
+        self.class_id = array('B')
+        # Sparse entity id -> slot, -1 when the id is free
+        self.slot = array('i', [-1])
+        self.free_ids = deque()
+        self.next_id = 1
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, eid):
+        return 0 < eid < len(self.slot) and self.slot[eid] >= 0
+
+    def _new_id(self):
+        if len(self.free_ids) > FREE_ID_RESERVE or (self.next_id > MAX_ENTITY_ID and self.free_ids):
+            return self.free_ids.popleft()
+        if self.next_id > MAX_ENTITY_ID:
+            raise RuntimeError("Entity id space exhausted")
+        eid = self.next_id
+        self.next_id += 1
+        self.slot.append(-1)
+        return eid
+
+    def add(self, kind, x=0, y=0, sx=1, sy=1, hp=0, type_id=0, class_id=0):
+        """Create an entity and return its id."""
+        eid = self._new_id()
+        self.slot[eid] = len(self.ids)
+        self.ids.append(eid)
+        self.kind.append(kind)
+        self.x.append(x)
+        self.y.append(y)
+        self.sx.append(sx)
+        self.sy.append(sy)
+        self.hp.append(hp)
+        self.max_hp.append(hp)
+        self.type_id.append(type_id)
+        self.class_id.append(class_id)
+        return eid
+
+    def remove(self, eid):
+        if eid not in self:
+            return
+        i = self.slot[eid]
+        last = len(self.ids) - 1
+        for column in (self.ids, self.kind, self.x, self.y, self.sx, self.sy, self.hp, self.max_hp, self.type_id, self.class_id):
+            column[i] = column[last]
+            column.pop()
+        if i != last:
+            self.slot[self.ids[i]] = i
+        self.slot[eid] = -1
+        self.free_ids.append(eid)
+
+    def pos(self, eid):
+        """Tile and subtile position as [x, y, sx, sy]."""
+        i = self.slot[eid]
+        return [self.x[i], self.y[i], self.sx[i], self.sy[i]]
+
+    def tile(self, eid):
+        i = self.slot[eid]
+        return self.x[i], self.y[i]
+
+    def set_pos(self, eid, x, y, sx=None, sy=None):
+        i = self.slot[eid]
+        self.x[i] = x
+        self.y[i] = y
+        if sx is not None:
+            self.sx[i] = sx
+            self.sy[i] = sy
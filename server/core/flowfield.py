@@ -0,0 +1,79 @@
+from array import array
+
+# Monsters chase players that are within this many walkable steps
+AGGRO_RANGE = 12
+# Monsters take one tile step every this many ticks
+MONSTER_STEP_TICKS = 4
+# Distance value for tiles that are blocked or out of range of every player
+UNREACHED = 0xFFFF
+
+class FlowField:
+    """Dijkstra map of walking distance (in tiles) to the nearest player, shared by all monsters in a party.
+
+    The field is recomputed only when the set of tiles occupied by players
+    changes, and the flood stops at AGGRO_RANGE, so its cost depends on player
+    count and aggro range rather than map size. Each monster then steers by
+    reading the distances of its four neighbours.
+    """
+
+    def __init__(self, game_map, max_distance=AGGRO_RANGE):
+        self.game_map = game_map
+        self.max_distance = max_distance
+        self.dist = array('H', [UNREACHED]) * (game_map.width * game_map.height)
+        self.sources = frozenset()
+        self.touched = []
+
+    def update(self, tiles):
+        """Recompute the field if the player tiles changed. Returns True if it was rebuilt."""
+        sources = frozenset(tiles)
+        if sources == self.sources:
+            return False
+        self.sources = sources
+        dist = self.dist
+        # Only reset what the previous flood wrote
+        for i in self.touched:
+            dist[i] = UNREACHED
+        game_map = self.game_map
+        w = game_map.stride
+        size = len(dist)
+        walkable = game_map.walkable
+        frontier = []
+        for x, y in sources:
+            i = y*w + x
+            if 0 <= x < game_map.width and 0 <= y < game_map.height and dist[i] != 0:
+                dist[i] = 0
+                frontier.append(i)
+        touched = list(frontier)
+        d = 0
+        while frontier and d < self.max_distance:
+            d += 1
+            next_frontier = []
+            for i in frontier:
+                x = i % w
+                for n in (i - w, i + w, i - 1 if x > 0 else -1, i + 1 if x < w - 1 else -1):
+                    if 0 <= n < size and walkable[n] and dist[n] == UNREACHED:
+                        dist[n] = d
+                        next_frontier.append(n)
+            touched.extend(next_frontier)
+            frontier = next_frontier
+        self.touched = touched
+        return True
+
+    def distance(self, x, y):
+        return self.dist[y*self.game_map.stride + x]
+
+    def next_step(self, x, y, blocked=()):
+        """Neighbouring tile that moves a monster at (x, y) closer to a player, or None."""
+        w = self.game_map.stride
+        dist = self.dist
+        best = dist[y*w + x]
+        if best == UNREACHED or best <= 1:
+            return None
+        step = None
+        for nx, ny in ((x, y-1), (x, y+1), (x-1, y), (x+1, y)):
+            if 0 <= nx < self.game_map.width and 0 <= ny < self.game_map.height:
+                d = dist[ny*w + nx]
+                if d < best and (nx, ny) not in blocked:
+                    best = d
+                    step = (nx, ny)
+        return step
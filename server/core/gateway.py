@@ -0,0 +1,119 @@
+import asyncio
+import json
+import websockets
+from shared.log import get_logger
+from shared.protocol import decode_message
+from .metrics import Metrics
+from .party import get_party_id, shard_for_party
+from .persistence import valid_profile_id
+from .server import requested_progress
+
+log = get_logger("server.gateway")
+
+# Worker i of N listens on WORKER_BASE_PORT + i
+WORKER_BASE_PORT = 8800
+
+def worker_uri(index, host="localhost", base_port=WORKER_BASE_PORT):
+    return f"ws://{host}:{base_port + index}"
+
+class Gateway:
+    """Front door for a sharded server: routes each session to the worker process that owns its party.
+
+    The gateway reads the client's class_select, resolves the party the client
+    will join, and forwards the class_select (with the act/zone filled in) to
+    the owning worker. From then on frames are relayed untouched in both
+    directions. When a worker answers with a "transfer" message (the player took
+    an exit into a party owned by another worker), the gateway reconnects the
+    session to that worker; the client only sees a new welcome.
+    """
+
+    def __init__(self, worker_count, worker_host="localhost", base_port=WORKER_BASE_PORT, allow_zone_select=False, store=None):
+        self.worker_count = worker_count
+        # Profile store the workers write to, read to route returning players to their saved zone
+        self.store = store
+        self.worker_host = worker_host
+        self.base_port = base_port
+        self.allow_zone_select = allow_zone_select
+        self.metrics = Metrics()
+        self.sessions = [0] * worker_count
+        self.metrics.gauge("gateway_sessions", lambda: sum(self.sessions))
+
+    async def connect_worker(self, select, progress):
+        """Open a worker connection for `progress` and replay the class selection on it."""
+        party_id = get_party_id(progress["act"], progress["zone"], progress.get("endgame_depth"))
+        index = shard_for_party(party_id, self.worker_count)
+        with self.metrics.time("worker_connect"):
+            worker = await websockets.connect(worker_uri(index, self.worker_host, self.base_port), max_size=None)
+        payload = dict(select.get("payload") or {})
+        payload.update(progress)
+        await worker.send(json.dumps({"type": "class_select", "payload": payload}))
+        self.metrics.counter("routed", worker=index).inc()
+        return worker, index
+
+    async def handler(self, client):
+        # Hold the session at the gateway until the client has picked a class
+        while True:
+            message = await client.recv()
+            try:
+                data = decode_message(message)
+            except ValueError:
+                continue
+            if data.get("type") == "class_select":
+                select = data
+                break
+            if data.get("type") == "stats":
+                await client.send(json.dumps({"type": "stats", "payload": {"format": "json", **self.metrics.snapshot()}}))
+            else:
+                await client.send(json.dumps({"type": "error", "payload": {"msg": "Please select a class first."}}))
+        progress = {"act": 1, "zone": 1, "endgame_depth": None}
+        profile_id = (select.get("payload") or {}).get("profile_id")
+        if self.store is not None and valid_profile_id(profile_id):
+            # Workers own the hot copies, so read what they last flushed
+            record = await self.store.load(profile_id, cached=False)
+            if record:
+                progress = {"act": record["act"], "zone": record["zone"], "endgame_depth": record["endgame_depth"]}
+        if self.allow_zone_select:
+            progress = requested_progress(select.get("payload") or {}) or progress
+        session = {}
+        session["worker"], index = await self.connect_worker(select, progress)
+        self.sessions[index] += 1
+        upstream = asyncio.create_task(self._relay_upstream(client, session))
+        try:
+            while True:
+                worker = session["worker"]
+                try:
+                    message = await worker.recv()
+                except websockets.ConnectionClosed:
+                    break
+                if isinstance(message, str) and '"transfer"' in message:
+                    data = json.loads(message)
+                    if data.get("type") == "transfer":
+                        self.sessions[index] -= 1
+                        session["worker"], index = await self.connect_worker(select, data["payload"])
+                        self.sessions[index] += 1
+                        self.metrics.counter("transfers").inc()
+                        await worker.close()
+                        continue
+                await client.send(message)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.sessions[index] -= 1
+            upstream.cancel()
+            await session["worker"].close()
+            await client.close()
+
+    async def _relay_upstream(self, client, session):
+        async for message in client:
+            try:
+                await session["worker"].send(message)
+            except websockets.ConnectionClosed:
+                # The worker is being swapped for a zone transfer; moves sent meanwhile are dropped
+                self.metrics.counter("dropped_during_transfer").inc()
+        await session["worker"].close()
+
+async def start_gateway(gateway, host="localhost", port=8765, reuse_port=False):
+    """Serve the gateway. With reuse_port, several gateway processes can share the port (Linux/BSD)."""
+    log.info("Gateway on ws://%s:%d routing to %d workers from port %d", host, port, gateway.worker_count, gateway.base_port)
+    async with websockets.serve(gateway.handler, host, port, reuse_port=reuse_port or None):
+        await asyncio.Future()  # run forever
@@ -0,0 +1,168 @@
+import asyncio
+import time
+
+# Histogram resolution: each power of two is split into this many linear sub-buckets (~6% relative error)
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+# Interval of the event loop lag probe, in seconds
+LOOP_LAG_INTERVAL = 0.1
+
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+class Histogram:
+    """HDR-style log-linear histogram of non-negative integer samples (microseconds for timings).
+
+    Recording is O(1) and memory is bounded by the value range, not the sample count.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @staticmethod
+    def _index(v):
+        if v < SUB_BUCKETS * 2:
+            return v
+        shift = v.bit_length() - SUB_BUCKET_BITS - 1
+        return (shift << SUB_BUCKET_BITS) + (v >> shift)
+
+    @staticmethod
+    def _value(index):
+        # Upper bound of the bucket, so percentiles never under-report
+        if index < SUB_BUCKETS * 2:
+            return index
+        shift = (index >> SUB_BUCKET_BITS) - 1
+        sub = index - (shift << SUB_BUCKET_BITS)
+        return ((sub + 1) << shift) - 1
+
+    def record(self, v):
+        v = int(v)
+        if v < 0:
+            v = 0
+        i = self._index(v)
+        self.buckets[i] = self.buckets.get(i, 0) + 1
+        self.count += 1
+        self.total += v
+        if v > self.max:
+            self.max = v
+
+    def percentile(self, q):
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for i in sorted(self.buckets):
+            seen += self.buckets[i]
+            if seen >= rank:
+                return min(self._value(i), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0,
+            "max": self.max,
+            **{f"p{q*100:g}": self.percentile(q) for q in QUANTILES}
+        }
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.record((time.perf_counter() - self.start) * 1_000_000)
+        return False
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+class Metrics:
+    """Registry of counters, gauges and histograms keyed by name and labels."""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        # name -> zero-argument callable returning the current value
+        self.gauges = {}
+
+    def counter(self, name, **labels):
+        key = _key(name, labels)
+        c = self.counters.get(key)
+        if c is None:
+            c = self.counters[key] = Counter()
+        return c
+
+    def histogram(self, name, **labels):
+        key = _key(name, labels)
+        h = self.histograms.get(key)
+        if h is None:
+            h = self.histograms[key] = Histogram()
+        return h
+
+    def time(self, name, **labels):
+        """Context manager recording elapsed microseconds into a histogram."""
+        return _Timer(self.histogram(name, **labels))
+
+    def gauge(self, name, fn):
+        self.gauges[name] = fn
+
+    def snapshot(self):
+        """JSON-friendly view of every metric."""
+        def label_str(labels):
+            return ",".join(f"{k}={v}" for k, v in labels)
+        return {
+            "counters": {f"{n}{{{label_str(l)}}}" if l else n: c.value for (n, l), c in self.counters.items()},
+            "gauges": {n: fn() for n, fn in self.gauges.items()},
+            "histograms_us": {f"{n}{{{label_str(l)}}}" if l else n: h.summary() for (n, l), h in self.histograms.items()}
+        }
+
+    def prometheus(self):
+        """Prometheus text exposition; histograms are exported as summaries in seconds."""
+        def fmt_labels(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+        lines = []
+        seen = set()
+        for (name, labels), c in sorted(self.counters.items()):
+            if name not in seen:
+                lines.append(f"# TYPE {name} counter")
+                seen.add(name)
+            lines.append(f"{name}{fmt_labels(labels)} {c.value}")
+        for name, fn in sorted(self.gauges.items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {fn()}")
+        for (name, labels), h in sorted(self.histograms.items()):
+            metric = f"{name}_seconds"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} summary")
+                seen.add(metric)
+            for q in QUANTILES:
+                lines.append(f"{metric}{fmt_labels(labels, [('quantile', q)])} {h.percentile(q) / 1e6:.6f}")
+            lines.append(f"{metric}_sum{fmt_labels(labels)} {h.total / 1e6:.6f}")
+            lines.append(f"{metric}_count{fmt_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+async def loop_lag_probe(metrics, interval=LOOP_LAG_INTERVAL):
+    """Record how late the event loop wakes a sleeping task, i.e. how long other work held the loop."""
+    lag = metrics.histogram("event_loop_lag")
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag.record((time.perf_counter() - start - interval) * 1_000_000)
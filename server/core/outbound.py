@@ -0,0 +1,152 @@
+import asyncio
+import time
+from collections import deque
+import websockets
+from shared.log import get_logger
+from shared.protocol import CODEC_JSON, encode_message
+
+log = get_logger("server.net")
+
+# Frames queued per connection before state frames start collapsing
+OUTBOUND_QUEUE_LIMIT = 32
+# Seconds a connection may stay over the limit before it is disconnected
+SLOW_CONSUMER_TIMEOUT = 5.0
+
+def merge_tick_frames(older, newer):
+    """Collapse two tick frames into one, keeping only the latest state per entity."""
+    old, new = older["payload"], newer["payload"]
+    moves = {m["eid"]: m for m in old["moves"]}
+    monsters = {m["eid"]: m for m in old["monsters"]}
+    removed = set(old["removed"])
+    for m in new["moves"]:
+        moves[m["eid"]] = m
+        removed.discard(m["eid"])
+    for m in new["monsters"]:
+        monsters[m["eid"]] = m
+        removed.discard(m["eid"])
+    for eid in new["removed"]:
+        moves.pop(eid, None)
+        monsters.pop(eid, None)
+        removed.add(eid)
+    return {
+        "type": "tick",
+        "payload": {
+            "tick": new["tick"],
+            "moves": list(moves.values()),
+            "monsters": list(monsters.values()),
+            "removed": list(removed)
+        }
+    }
+
+class Outbound:
+    """Bounded outbound queue drained by a dedicated writer task for one connection.
+
+    Senders never await the socket. When the queue is full and ends with a tick
+    frame, a new tick frame is merged into it instead of growing the queue, and a
+    client that stays over the limit for SLOW_CONSUMER_TIMEOUT is disconnected.
+    """
+
+    def __init__(self, connection, client_id, limit=OUTBOUND_QUEUE_LIMIT, evict_after=SLOW_CONSUMER_TIMEOUT):
+        self.connection = connection
+        self.client_id = client_id
+        self.limit = limit
+        self.evict_after = evict_after
+        # Wire codec, agreed during class selection
+        self.codec = CODEC_JSON
+        # Entries are [encoded_message, frame]; frame is set only for collapsible tick frames
+        self.queue = deque()
+        self.ready = asyncio.Event()
+        self.task = None
+        self.over_limit_since = None
+        self.evicted = False
+        # (code, reason) once the connection should be closed after the queue drains
+        self.closing = None
+        self.sent = 0
+        self.dropped = 0
+        self.collapsed = 0
+        self.peak_depth = 0
+
+    def start(self):
+        self.task = asyncio.create_task(self._writer())
+        return self
+
+    def send(self, message, frame=None):
+        """Queue an encoded message for delivery. Pass the tick frame dict as well to allow collapsing."""
+        if self.evicted or self.closing:
+            self.dropped += 1
+            return
+        # Only merge into a tick frame at the very end of the queue: merging past a later message
+        # (e.g. the welcome for a new zone) would deliver state before the message that resets it
+        if frame is not None and len(self.queue) >= self.limit and self.queue[-1][1] is not None:
+            entry = self.queue[-1]
+            entry[1] = merge_tick_frames(entry[1], frame)
+            entry[0] = None  # re-encoded by the writer
+            self.collapsed += 1
+            self._check_slow()
+            return
+        self.queue.append([message, frame])
+        self.peak_depth = max(self.peak_depth, len(self.queue))
+        self.ready.set()
+        self._check_slow()
+
+    def _check_slow(self):
+        if len(self.queue) < self.limit:
+            self.over_limit_since = None
+            return
+        now = time.monotonic()
+        if self.over_limit_since is None:
+            self.over_limit_since = now
+        elif now - self.over_limit_since > self.evict_after:
+            self.evict()
+
+    def evict(self):
+        if self.evicted:
+            return
+        self.evicted = True
+        self.dropped += len(self.queue)
+        self.queue.clear()
+        log.warning("Disconnecting slow consumer %s (over queue limit for %ss)", self.client_id, self.evict_after)
+        asyncio.ensure_future(self.connection.close(code=1008, reason="slow consumer"))
+
+    def finish(self, code=1000, reason=""):
+        """Close the connection once everything already queued has been sent."""
+        if self.closing is None:
+            self.closing = (code, reason)
+            self.ready.set()
+
+    async def _writer(self):
+        try:
+            while True:
+                await self.ready.wait()
+                while self.queue:
+                    message, frame = self.queue.popleft()
+                    if message is None:
+                        message = encode_message(frame, self.codec)
+                    await self.connection.send(message)
+                    self.sent += 1
+                    if len(self.queue) < self.limit:
+                        self.over_limit_since = None
+                if self.closing:
+                    await self.connection.close(*self.closing)
+                    return
+                self.ready.clear()
+        except websockets.ConnectionClosed:
+            pass
+
+    def close(self):
+        if self.task:
+            self.task.cancel()
+
+    def stats(self):
+        return {
+            "depth": len(self.queue),
+            "peak_depth": self.peak_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "collapsed": self.collapsed,
+            "evicted": self.evicted
+        }
+
+def outbound_stats(state):
+    """Per-connection queue depth and drop counters."""
+    return {client_id: out.stats() for client_id, out in state['outbound'].items()}
@@ -1,6 +1,200 @@
+import asyncio
+import heapq
+import random
+import time
+import zlib
+from shared.log import get_logger
+from shared.map import GameMap, map_hash
+from shared.maps_campaign import get_campaign_map
+from shared.maps_endgame import generate_endgame_map
+from shared.protocol import MONSTER_TYPE_IDS
+from .aoi import SpatialHash
+from .entities import KIND_MONSTER
+from .flowfield import FlowField
+
+log = get_logger("server.party")
+
+# Seconds an empty party instance is kept before it is torn down
+EMPTY_PARTY_GRACE = 60.0
+# Longest the reaper sleeps between checks
+REAPER_INTERVAL = 1.0
+
+# Zones per campaign act; leaving the last zone of the last act enters the endgame
+ZONES_PER_ACT = 10
+CAMPAIGN_ACTS = 3
+
 def get_party_id(act, zone, endgame_depth=None):
     if act > 3:
         return f"endgame_{endgame_depth or 1}"
     return f"act{act}_zone{zone}"
 
+def next_progress(progress):
+    """Progress after taking the exit of the current zone."""
+    act, zone = progress["act"], progress["zone"]
+    if act > CAMPAIGN_ACTS:
+        return {"act": act, "zone": zone, "endgame_depth": (progress.get("endgame_depth") or 1) + 1}
+    if zone < ZONES_PER_ACT:
+        return {"act": act, "zone": zone + 1, "endgame_depth": None}
+    if act < CAMPAIGN_ACTS:
+        return {"act": act + 1, "zone": 1, "endgame_depth": None}
+    return {"act": CAMPAIGN_ACTS + 1, "zone": 1, "endgame_depth": 1}
+
+def shard_for_party(party_id, shard_count):
+    """Index of the worker process that owns a party when parties are sharded across processes."""
+    return zlib.crc32(party_id.encode()) % shard_count
+
+def get_or_create_party(state, act, zone, endgame_depth=None):
+    party_id = get_party_id(act, zone, endgame_depth)
+    parties = state['parties']
+    if party_id not in parties:
+        if act > 3:
+            depth = endgame_depth or 1
+            pool = state['endgame_pool']
+            map_data = pool.take(depth) if pool is not None else None
+            if map_data is not None:
+                state['metrics'].counter("endgame_maps", source="pool").inc()
+                game_map = GameMap.from_grid(map_data["grid"])
+            else:
+                # Nothing pregenerated (no pool, or its generation failed): generate here, blocking the loop
+                state['metrics'].counter("endgame_maps", source="inline").inc()
+                with state['metrics'].time("map_generation", kind="endgame"):
+                    map_data = generate_endgame_map(depth=depth, seed=random.getrandbits(32))
+                    game_map = GameMap.from_grid(map_data["grid"])
+        else:
+            with state['metrics'].time("map_generation", kind="campaign"):
+                map_data = get_campaign_map(act, zone)
+                if map_data:
+                    game_map = GameMap.from_grid(map_data["grid"])
+                else:
+                    game_map = GameMap(20, 20)
+                    map_data = game_map.to_dict()
+        if not game_map.walkable_cells:
+            raise ValueError(f"Map for party {party_id} has no walkable tiles")
+        parties[party_id] = {
+            "act": act,
+            "zone": zone,
+            "endgame_depth": endgame_depth,
+            "members": set(),
+            "map": game_map,
+            "map_data": map_data,
+            "map_hash": map_hash(game_map),
+            "map_packed": None,
+            "created": time.time(),
+            "invites": set(),
+            "kick_votes": {},
+            "intents": {},
+            # Latest path intent per member, and the paths members are walking
+            "path_intents": {},
+            "walks": {},
+            # Members who stepped onto an exit tile this tick
+            "exits": [],
+            # Area of interest: entity positions, member client ids by entity id,
+            # and the entity ids each member currently has replicated
+            "aoi": SpatialHash(),
+            "member_eids": {},
+            "visible": {},
+            "aoi_dirty": False,
+            # Packed map chunks as (version, message), and per streaming member the chunk versions sent
+            "chunk_packed": {},
+            "chunk_streams": {},
+            # Distance-to-nearest-player field that monsters steer by
+            "flow_field": FlowField(game_map),
+            # Bumped whenever a pending expiry is scheduled or cancelled; stale heap entries are skipped
+            "expiry_gen": 0
+        }
+        # Spawn monsters for this party instance
+        state['monsters'][party_id] = []
+        for i in range(10):
+            mx, my = game_map.random_walkable_cell()
+            eid = state['entities'].add(
+                KIND_MONSTER, mx, my,
+                hp=10,
+                type_id=MONSTER_TYPE_IDS[random.choice(["goblin", "skeleton", "slime"])]
+            )
+            state['monsters'][party_id].append(eid)
+            parties[party_id]["aoi"].insert(eid, mx, my)
+    return party_id
+
+def join_party(state, client_id):
+    """Add a client to the party for its current progress and spawn it there. Returns the party id."""
+    progress = state['player_progress'][client_id]
+    party_id = get_or_create_party(state, progress["act"], progress["zone"], progress.get("endgame_depth"))
+    party = state['parties'][party_id]
+    party["members"].add(client_id)
+    cancel_party_expiry(state, party_id)
+    entity_id = state['entity_ids'][client_id]
+    # Spawn on the first walkable tile (centre subtile)
+    x, y = party["map"].first_walkable_cell()
+    state['entities'].set_pos(entity_id, x, y, 1, 1)
+    party["aoi"].insert(entity_id, x, y)
+    party["member_eids"][entity_id] = client_id
+    party["visible"][client_id] = set()
+    party["aoi_dirty"] = True
+    state['player_party'][client_id] = party_id
+    return party_id
+
+def leave_party(state, client_id):
+    """Remove a client from its current party, scheduling the party's expiry if it is now empty."""
+    party_id = state['player_party'].pop(client_id, None)
+    state['pending_transfers'].discard(client_id)
+    party = state['parties'].get(party_id)
+    if party is None:
+        return
+    entity_id = state['entity_ids'][client_id]
+    party["members"].discard(client_id)
+    party["intents"].pop(client_id, None)
+    party["path_intents"].pop(client_id, None)
+    party["walks"].pop(client_id, None)
+    party["chunk_streams"].pop(client_id, None)
+    party["aoi"].remove(entity_id)
+    party["member_eids"].pop(entity_id, None)
+    party["visible"].pop(client_id, None)
+    party["aoi_dirty"] = True
+    if not party["members"]:
+        # The reaper tears the instance down if nobody rejoins within the grace period
+        schedule_party_expiry(state, party_id)
+
+def schedule_party_expiry(state, party_id):
+    """Queue an empty party for teardown after the configured grace period. O(log n)."""
+    party = state['parties'][party_id]
+    party["expiry_gen"] += 1
+    grace = state['config'].get('party_grace', EMPTY_PARTY_GRACE)
+    heapq.heappush(state['party_expiry'], (time.monotonic() + grace, party["expiry_gen"], party_id))
+
+def cancel_party_expiry(state, party_id):
+    """Invalidate any pending expiry for a party (someone joined). O(1); the heap entry is dropped lazily."""
+    state['parties'][party_id]["expiry_gen"] += 1
+
+def delete_party(state, party_id):
+    """Remove a party instance and release its monster entities."""
+    del state['parties'][party_id]
+    for eid in state['monsters'].pop(party_id, ()):
+        state['entities'].remove(eid)
+
+def reap_expired_parties(state, now=None):
+    """Delete parties whose expiry is due and who are still empty. Returns the deleted party ids."""
+    now = time.monotonic() if now is None else now
+    heap = state['party_expiry']
+    reaped = []
+    while heap and heap[0][0] <= now:
+        _, gen, party_id = heapq.heappop(heap)
+        party = state['parties'].get(party_id)
+        if party is None or party["expiry_gen"] != gen or party["members"]:
+            continue
+        delete_party(state, party_id)
+        state['metrics'].counter("parties_reaped").inc()
+        reaped.append(party_id)
+    return reaped
+
+async def party_reaper(state):
+    """Background task tearing down parties that stayed empty past their grace period."""
+    while True:
+        for party_id in reap_expired_parties(state):
+            log.info("Party %s expired after being empty.", party_id)
+        heap = state['party_expiry']
+        delay = REAPER_INTERVAL
+        if heap:
+            delay = min(delay, max(0.0, heap[0][0] - time.monotonic()))
+        await asyncio.sleep(delay)
+
 # ...move more party/instance logic here as needed...
@@ -0,0 +1,169 @@
+import asyncio
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from shared.log import get_logger
+
+log = get_logger("server.persistence")
+
+# Seconds between write-behind flushes of dirty profiles
+FLUSH_INTERVAL = 2.0
+# Profiles kept in memory after their player leaves
+HOT_PROFILES = 4096
+# Longest accepted client-supplied profile id
+MAX_PROFILE_ID_LENGTH = 64
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    profile_id TEXT PRIMARY KEY,
+    class TEXT,
+    act INTEGER NOT NULL,
+    zone INTEGER NOT NULL,
+    endgame_depth INTEGER,
+    level INTEGER NOT NULL,
+    xp INTEGER NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+def profile_record(state, client_id):
+    """Snapshot of the persisted fields of a connected player."""
+    progress = state['player_progress'][client_id]
+    xp = state['player_xp'][client_id]
+    info = state['player_info'].get(client_id) or {}
+    return {
+        "class": info.get("class"),
+        "act": progress["act"],
+        "zone": progress["zone"],
+        "endgame_depth": progress.get("endgame_depth"),
+        "level": xp["level"],
+        "xp": xp["xp"]
+    }
+
+def save_profile(state, client_id):
+    """Queue a connected player's profile for the next flush, if it has one."""
+    store = state['profiles']
+    profile_id = state['profile_ids'].get(client_id)
+    if store is not None and profile_id is not None and client_id in state['player_info']:
+        store.mark_dirty(profile_id, profile_record(state, client_id))
+
+def valid_profile_id(profile_id):
+    return isinstance(profile_id, str) and 0 < len(profile_id) <= MAX_PROFILE_ID_LENGTH
+
+class ProfileStore:
+    """Player profiles in SQLite (WAL mode) with write-behind and an LRU of hot profiles.
+
+    The event loop never touches the database: loads and batched flushes run on
+    a single background thread that owns the connection. Changes are recorded
+    with mark_dirty() and written by the periodic flusher, so gameplay never
+    waits on disk.
+    """
+
+    def __init__(self, path, flush_interval=FLUSH_INTERVAL, capacity=HOT_PROFILES):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.capacity = capacity
+        # profile_id -> record; most recently used last
+        self.hot = OrderedDict()
+        # profile_id -> record waiting to be written
+        self.dirty = {}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profiles")
+        self.db = None
+        self.flushes = 0
+        self.written = 0
+
+    # --- database thread ---
+
+    def _connect(self):
+        if self.db is None:
+            self.db = sqlite3.connect(self.path, timeout=10.0)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(SCHEMA)
+            self.db.commit()
+        return self.db
+
+    def _read(self, profile_id):
+        row = self._connect().execute(
+            "SELECT class, act, zone, endgame_depth, level, xp FROM profiles WHERE profile_id = ?", (profile_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("class", "act", "zone", "endgame_depth", "level", "xp"), row))
+
+    def _write(self, batch):
+        db = self._connect()
+        now = time.time()
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO profiles (profile_id, class, act, zone, endgame_depth, level, xp, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(pid, r["class"], r["act"], r["zone"], r["endgame_depth"], r["level"], r["xp"], now) for pid, r in batch]
+            )
+
+    def _close_db(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    # --- event loop side ---
+
+    def _remember(self, profile_id, record):
+        self.hot[profile_id] = record
+        self.hot.move_to_end(profile_id)
+        while len(self.hot) > self.capacity:
+            self.hot.popitem(last=False)
+
+    async def load(self, profile_id, cached=True):
+        """The stored record for a profile, or None if it has never been saved.
+
+        Pass cached=False to skip the in-memory copies, e.g. when another
+        process may have written the profile since.
+        """
+        if cached:
+            record = self.dirty.get(profile_id)
+            if record is None:
+                record = self.hot.get(profile_id)
+            if record is not None:
+                self._remember(profile_id, record)
+                return dict(record)
+        record = await asyncio.get_running_loop().run_in_executor(self.executor, self._read, profile_id)
+        if record is not None and cached:
+            self._remember(profile_id, record)
+        return dict(record) if record is not None else None
+
+    def mark_dirty(self, profile_id, record):
+        """Queue a profile for the next flush. O(1); never blocks."""
+        self.dirty[profile_id] = record
+        self._remember(profile_id, record)
+
+    def forget(self, profile_id):
+        """Drop the hot copy (the profile now lives in another process); pending writes are kept."""
+        self.hot.pop(profile_id, None)
+
+    async def flush(self):
+        if not self.dirty:
+            return
+        batch, self.dirty = self.dirty, {}
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self._write, list(batch.items()))
+        except sqlite3.Error:
+            log.exception("Profile flush failed; %d profiles will be retried", len(batch))
+            # Keep anything that was not re-dirtied in the meantime
+            for profile_id, record in batch.items():
+                self.dirty.setdefault(profile_id, record)
+            return
+        self.flushes += 1
+        self.written += len(batch)
+
+    async def flusher(self):
+        """Background task writing dirty profiles every flush_interval seconds."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def close(self):
+        await self.flush()
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._close_db)
+        self.executor.shutdown(wait=True)
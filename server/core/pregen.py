@@ -0,0 +1,87 @@
+import asyncio
+import multiprocessing
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from shared.log import get_logger
+from shared.maps_endgame import generate_endgame_map
+
+log = get_logger("server.pregen")
+
+# Maps kept ready (or being generated) per endgame depth
+POOL_MAPS_PER_DEPTH = 2
+# Depths prepared beyond the one a party was just opened at
+POOL_LOOKAHEAD = 2
+POOL_WORKERS = 1
+
+class EndgamePool:
+    """Endgame maps generated ahead of time in worker processes.
+
+    Opening an endgame party takes a finished map with take(), which never
+    generates anything itself. Each take() tops up the pool for that depth
+    and the next few, so by the time a party reaches the exit of depth N the
+    map for N+1 is usually already waiting. Generation runs in a process pool
+    and never holds up the event loop.
+    """
+
+    def __init__(self, maps_per_depth=POOL_MAPS_PER_DEPTH, lookahead=POOL_LOOKAHEAD, workers=POOL_WORKERS, owns=None):
+        self.maps_per_depth = maps_per_depth
+        self.lookahead = lookahead
+        # Spawned rather than forked so workers don't inherit the server's sockets and logging thread
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        # Depths this process opens parties for; sharded workers only prepare their own
+        self.owns = owns or (lambda depth: True)
+        # depth -> finished map dicts, oldest first
+        self.ready = {}
+        # depth -> futures of maps being generated
+        self.pending = {}
+        self.generated = 0
+
+    def prefetch(self, depth):
+        """Make sure enough maps are ready or on the way for `depth` and the depths after it."""
+        for d in range(max(1, depth), depth + self.lookahead + 1):
+            if not self.owns(d):
+                continue
+            pending = self.pending.setdefault(d, set())
+            while len(self.ready.get(d, ())) + len(pending) < self.maps_per_depth:
+                future = asyncio.wrap_future(
+                    self.executor.submit(generate_endgame_map, d, None, None, random.getrandbits(32))
+                )
+                pending.add(future)
+                future.add_done_callback(partial(self._finished, d))
+
+    def _finished(self, depth, future):
+        self.pending[depth].discard(future)
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            log.error("Endgame map generation for depth %d failed: %r", depth, future.exception())
+            return
+        self.ready.setdefault(depth, deque()).append(future.result())
+        self.generated += 1
+
+    def has_ready(self, depth):
+        return bool(self.ready.get(depth))
+
+    def take(self, depth):
+        """A finished map for `depth`, or None if none is ready yet. Never blocks."""
+        maps = self.ready.get(depth)
+        map_data = maps.popleft() if maps else None
+        self.prefetch(depth)
+        return map_data
+
+    async def wait(self, depth):
+        """Wait (without blocking the loop) until a map for `depth` is ready, e.g. before a player joins there."""
+        self.prefetch(depth)
+        while not self.ready.get(depth) and self.pending.get(depth):
+            await asyncio.wait(self.pending[depth], return_when=asyncio.FIRST_COMPLETED)
+
+    def ready_count(self):
+        return sum(len(maps) for maps in self.ready.values())
+
+    def close(self):
+        for pending in self.pending.values():
+            for future in pending:
+                future.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,177 +1,239 @@
 import asyncio
+import time
 import websockets
 import uuid
 import json
-import time
-from shared.map import GameMap
-from shared.maps_campaign import get_campaign_map, SUBTILES_PER_TILE, is_walkable_subtile
+from shared.log import get_logger
 from shared.maps_city import get_city_map
-from shared.maps_endgame import generate_endgame_map
-from .party import get_party_id
-from .classes import CLASSES, CLASS_MAIN_STAT
+from shared.protocol import MAX_PATH_STEPS, decode_message, negotiate_codec
+from .party import get_party_id, join_party, leave_party, party_reaper
+from .chunks import MAX_CHUNK_REQUEST, send_chunks
+from .classes import CLASSES, CLASS_IDS, CLASS_MAIN_STAT, PLAYER_BASE_HP
+from .entities import KIND_PLAYER
+from .metrics import loop_lag_probe
+from .outbound import Outbound, outbound_stats
+from .persistence import save_profile, valid_profile_id
+from .session import map_data_message, welcome_message
+from .tick import DEFAULT_TICK_RATE, queue_move, queue_path, tick_loop
 
-def get_or_create_party(state, act, zone, endgame_depth=None):
-    party_id = get_party_id(act, zone, endgame_depth)
-    parties = state['parties']
-    if party_id not in parties:
-        if act > 3:
-            depth = endgame_depth or 1
-            map_data = generate_endgame_map(depth=depth)
-            game_map = GameMap(map_data["width"], map_data["height"])
-            game_map.grid = map_data["grid"]
-        else:
-            map_data = get_campaign_map(act, zone)
-            if map_data:
-                game_map = GameMap(map_data["width"], map_data["height"])
-                game_map.grid = map_data["grid"]
-            else:
-                game_map = GameMap(20, 20)
-                map_data = game_map.to_dict()
-        parties[party_id] = {
-            "act": act,
-            "zone": zone,
-            "endgame_depth": endgame_depth,
-            "members": set(),
-            "map": game_map,
-            "map_data": map_data,
-            "created": time.time(),
-            "invites": set(),
-            "kick_votes": {}
-        }
-        # Spawn monsters for this party instance
-        import random
-        state['monsters'][party_id] = []
-        for i in range(10):
-            while True:
-                mx = random.randint(0, game_map.width-1)
-                my = random.randint(0, game_map.height-1)
-                if game_map.grid[my][mx] == 0:
-                    break
-            state['monsters'][party_id].append({
-                "id": str(uuid.uuid4()),
-                "pos": [mx, my],
-                "type": random.choice(["goblin", "skeleton", "slime"]),
-                "hp": 10
-            })
-    return party_id
+log = get_logger("server")
+net_log = get_logger("server.net")
+
+# Message types timed individually; anything else is counted as "other" to keep label sets bounded
+MESSAGE_TYPES = ("class_select", "move", "path", "map_request", "chunk_request", "stats")
+
+def stats_message(state, payload):
+    """Admin snapshot of server metrics, as JSON or as Prometheus exposition text."""
+    metrics = state['metrics']
+    if (payload or {}).get("format") == "prometheus":
+        body = {"format": "prometheus", "text": metrics.prometheus()}
+    else:
+        body = {"format": "json", **metrics.snapshot(), "outbound": outbound_stats(state)}
+    return json.dumps({"type": "stats", "payload": body})
+
+def requested_progress(payload):
+    """Act/zone asked for in class_select (load testing only), or None if absent or out of range."""
+    act, zone, depth = payload.get("act"), payload.get("zone"), payload.get("endgame_depth")
+    if not isinstance(act, int) or not isinstance(zone, int):
+        return None
+    if 1 <= act <= 3 and 1 <= zone <= 10:
+        return {"act": act, "zone": zone, "endgame_depth": None}
+    if act > 3 and isinstance(depth, int) and depth >= 1:
+        return {"act": act, "zone": zone, "endgame_depth": depth}
+    return None
+
+def valid_position(pos):
+    """True for an [x, y, sx, sy] list of integers; bounds and walkability are checked by the tick."""
+    return isinstance(pos, list) and len(pos) == 4 and all(type(v) is int for v in pos)
+
+def valid_path_payload(payload):
+    path = payload.get("path")
+    return (isinstance(payload.get("seq"), int) and isinstance(path, list) and 0 < len(path) <= MAX_PATH_STEPS + 1
+            and all(valid_position(p) for p in path))
+
+def valid_chunk_list(chunks):
+    return (isinstance(chunks, list) and len(chunks) <= MAX_CHUNK_REQUEST
+            and all(isinstance(c, list) and len(c) == 2 and all(isinstance(v, int) for v in c) for c in chunks))
+
+def register_gauges(state):
+    metrics = state['metrics']
+    metrics.gauge("connections", lambda: len(state['connected_clients']))
+    metrics.gauge("parties", lambda: len(state['parties']))
+    metrics.gauge("entities", lambda: len(state['entities']))
+    metrics.gauge("outbound_queue_depth", lambda: sum(len(out.queue) for out in state['outbound'].values()))
+    metrics.gauge("outbound_dropped", lambda: sum(out.dropped for out in state['outbound'].values()))
+    metrics.gauge("tick", lambda: state['tick'])
+    if state['endgame_pool'] is not None:
+        metrics.gauge("endgame_maps_ready", state['endgame_pool'].ready_count)
 
 def make_handler(state):
+    metrics = state['metrics']
+
+    def parse(message):
+        """Decode a message, recording parse time and a receive count under its type."""
+        start = time.perf_counter()
+        data = decode_message(message)
+        elapsed = (time.perf_counter() - start) * 1_000_000
+        msg_type = data.get("type")
+        if msg_type not in MESSAGE_TYPES:
+            msg_type = "other"
+        metrics.histogram("parse", type=msg_type).record(elapsed)
+        metrics.counter("messages_received", type=msg_type).inc()
+        return data
+
     async def handler(connection):
         client_id = str(uuid.uuid4())
         state['connected_clients'][client_id] = connection
+        out = state['outbound'][client_id] = Outbound(connection, client_id).start()
+        # Short integer id used in place of the UUID on the wire
+        entity_id = state['entity_ids'][client_id] = state['entities'].add(KIND_PLAYER)
         # For demo: start all new players at act 1, zone 1
         state['player_progress'][client_id] = {"act": 1, "zone": 1, "endgame_depth": None}
         state['player_xp'][client_id] = {"level": 1, "xp": 0}
         # Do NOT assign class yet; wait for class_select from client
-        print(f"Client {client_id} connected, waiting for class selection.", flush=True)
-        party_id = None
+        log.info("Client %s connected, waiting for class selection.", client_id)
         try:
             # Wait for class_select message before proceeding
             while True:
                 message = await connection.recv()
-                print(f"[SERVER] Received from client: {message}", flush=True)
+                net_log.debug("Received from %s: %r", client_id, message)
                 try:
-                    data = json.loads(message)
+                    data = parse(message)
+                    if data.get("type") == "stats":
+                        out.send(stats_message(state, data.get("payload")))
+                        continue
                     if data.get("type") == "class_select":
                         class_name = data.get("class") or (data.get("payload") or {}).get("class")
-                        print(f"[SERVER] Class selection received: {class_name}", flush=True)
+                        log.info("Class selection received from %s: %s", client_id, class_name)
                         if class_name not in CLASSES:
-                            await connection.send(json.dumps({
+                            out.send(json.dumps({
                                 "type": "error", "payload": {"msg": "Invalid class."}
                             }))
                             continue
                         state['player_info'][client_id] = {"class": class_name, "stats": dict(CLASSES[class_name])}
+                        entities = state['entities']
+                        slot = entities.slot[entity_id]
+                        entities.class_id[slot] = CLASS_IDS[class_name]
+                        entities.hp[slot] = entities.max_hp[slot] = PLAYER_BASE_HP
+                        out.codec = negotiate_codec((data.get("payload") or {}).get("codecs"))
+                        profile_id = (data.get("payload") or {}).get("profile_id")
+                        if state['profiles'] is not None and valid_profile_id(profile_id):
+                            state['profile_ids'][client_id] = profile_id
+                            record = await state['profiles'].load(profile_id)
+                            if record:
+                                state['player_progress'][client_id] = {
+                                    "act": record["act"], "zone": record["zone"], "endgame_depth": record["endgame_depth"]
+                                }
+                                state['player_xp'][client_id] = {"level": record["level"], "xp": record["xp"]}
+                        if state['config'].get('allow_zone_select'):
+                            progress = requested_progress(data.get("payload") or {})
+                            if progress:
+                                state['player_progress'][client_id] = progress
                         break
                     else:
-                        await connection.send(json.dumps({
+                        out.send(json.dumps({
                             "type": "error", "payload": {"msg": "Please select a class first."}
                         }))
-                except json.JSONDecodeError:
-                    print(f"Invalid JSON from {client_id}: {message}", flush=True)
+                except ValueError:
+                    metrics.counter("messages_invalid").inc()
+                    net_log.warning("Invalid message from %s: %r", client_id, message)
             # Now assign party and spawn
-            act = state['player_progress'][client_id]["act"]
-            zone = state['player_progress'][client_id]["zone"]
-            endgame_depth = state['player_progress'][client_id].get("endgame_depth")
-            party_id = get_or_create_party(state, act, zone, endgame_depth)
-            state['parties'][party_id]["members"].add(client_id)
-            # Find a random floor subtile for spawn
-            game_map = state['parties'][party_id]["map"]
-            for y in range(game_map.height):
-                for x in range(game_map.width):
-                    if game_map.grid[y][x] == 0:
-                        state['player_states'][client_id] = {"pos": [x, y, 1, 1]}
-                        break
-                if client_id in state['player_states']:
-                    break
-            print(f"Client {client_id} joined party {party_id} (Act {act} Zone {zone}).", flush=True)
+            progress = state['player_progress'][client_id]
+            pool = state['endgame_pool']
+            if pool is not None and progress["act"] > 3 and get_party_id(progress["act"], progress["zone"], progress.get("endgame_depth")) not in state['parties']:
+                # Let the pool's worker processes build the map instead of generating it on the loop
+                await pool.wait(progress.get("endgame_depth") or 1)
+            party_id = join_party(state, client_id)
+            save_profile(state, client_id)
+            log.info("Client %s joined party %s (Act %s Zone %s).", client_id, party_id,
+                     state['player_progress'][client_id]["act"], state['player_progress'][client_id]["zone"])
             # Send a JSON welcome message with player_info and player_pos
-            print(f"[SERVER] Sending welcome message to {client_id}", flush=True)
-            welcome_msg = json.dumps({
-                "type": "welcome",
-                "sender": "server",
-                "payload": {
-                    "client_id": client_id,
-                    "map": state['parties'][party_id]["map_data"],
-                    "act": act,
-                    "zone": zone,
-                    "boss": state['parties'][party_id]["map_data"].get("boss"),
-                    "player_info": state['player_info'][client_id],
-                    "player_pos": state['player_states'][client_id]["pos"]
-                }
-            })
-            await connection.send(welcome_msg)
+            net_log.debug("Sending welcome message to %s", client_id)
+            out.send(welcome_message(state, client_id, party_id, out.codec))
             async for message in connection:
+                net_log.debug("Received from %s: %r", client_id, message)
                 try:
-                    data = json.loads(message)
+                    data = parse(message)
                     if "sender" not in data:
                         data["sender"] = client_id
                     if data.get("type") == "move":
-                        # Validate and update player position
-                        pos = data.get("payload", {}).get("pos")
-                        if pos and len(pos) == 4:
-                            x, y, sx, sy = pos
-                            grid = state['parties'][party_id]["map"].grid
-                            from shared.maps_campaign import SUBTILES_PER_TILE, is_walkable_subtile
-                            if 0 <= x < len(grid[0]) and 0 <= y < len(grid) and 0 <= sx < SUBTILES_PER_TILE and 0 <= sy < SUBTILES_PER_TILE:
-                                if is_walkable_subtile(grid, x, y, sx, sy):
-                                    state['player_states'][client_id]["pos"] = [x, y, sx, sy]
-                                    # Broadcast move to all party members
-                                    move_msg = json.dumps({
-                                        "type": "move",
-                                        "payload": {"pos": [x, y, sx, sy], "client_id": client_id}
-                                    })
-                                    for pid in state['parties'][party_id]["members"]:
-                                        ws = state['connected_clients'].get(pid)
-                                        if ws:
-                                            await ws.send(move_msg)
-                                    print(f"[SERVER] Move accepted and broadcast for {client_id}: {[x, y, sx, sy]}", flush=True)
-                                else:
-                                    print(f"[SERVER] Move rejected (not walkable) for {client_id}: {[x, y, sx, sy]}", flush=True)
-                            else:
-                                print(f"[SERVER] Move rejected (out of bounds) for {client_id}: {[x, y, sx, sy]}", flush=True)
+                        # Queue the intent; the tick loop validates, applies and broadcasts it
+                        pos = (data.get("payload") or {}).get("pos")
+                        if valid_position(pos):
+                            queue_move(state, state['player_party'].get(client_id), client_id, pos)
+                        else:
+                            net_log.warning("Invalid move payload from %s: %s", client_id, data)
+                    elif data.get("type") == "path":
+                        # The tick loop walks the path at a fixed speed, checking each step
+                        payload = data.get("payload") or {}
+                        path = payload.get("path")
+                        if valid_path_payload(payload):
+                            queue_path(state, state['player_party'].get(client_id), client_id, payload["seq"], path)
+                        else:
+                            net_log.warning("Invalid path payload from %s", client_id)
+                    elif data.get("type") == "stats":
+                        out.send(stats_message(state, data.get("payload")))
+                    elif data.get("type") == "map_request":
+                        party = state['parties'].get(state['player_party'].get(client_id))
+                        if party and (data.get("payload") or {}).get("hash") == party["map_hash"]:
+                            out.send(map_data_message(party))
                         else:
-                            print(f"[SERVER] Invalid move payload from {client_id}: {data}", flush=True)
+                            out.send(json.dumps({
+                                "type": "error", "payload": {"msg": "Unknown map."}
+                            }))
+                    elif data.get("type") == "chunk_request":
+                        # Chunks the client is missing; it is streamed chunks ahead of its movement from now on
+                        party = state['parties'].get(state['player_party'].get(client_id))
+                        payload = data.get("payload") or {}
+                        chunks = payload.get("chunks")
+                        if party and payload.get("hash") == party["map_hash"] and valid_chunk_list(chunks):
+                            send_chunks(state, client_id, party, [tuple(c) for c in chunks], resend=True)
+                        else:
+                            out.send(json.dumps({
+                                "type": "error", "payload": {"msg": "Unknown map."}
+                            }))
                     # ...existing message handling logic (teleport, party, emote, attack, etc.)...
-                except json.JSONDecodeError:
-                    print(f"Invalid JSON from {client_id}: {message}", flush=True)
+                except ValueError:
+                    metrics.counter("messages_invalid").inc()
+                    net_log.warning("Invalid message from %s: %r", client_id, message)
         except websockets.ConnectionClosed:
-            print(f"Client {client_id} disconnected.", flush=True)
+            log.info("Client %s disconnected.", client_id)
         finally:
+            save_profile(state, client_id)
+            if state['config'].get('shard') and state['profiles'] is not None:
+                # The gateway routes the next login from the database, so don't leave it stale
+                asyncio.ensure_future(state['profiles'].flush())
+            state['profile_ids'].pop(client_id, None)
+            leave_party(state, client_id)
             del state['connected_clients'][client_id]
-            del state['player_states'][client_id]
+            state['outbound'].pop(client_id).close()
             del state['player_progress'][client_id]
             del state['player_xp'][client_id]
-            del state['player_info'][client_id]
-            if party_id and party_id in state['parties']:
-                state['parties'][party_id]["members"].discard(client_id)
-            # Clean up empty party and expired zones
-            now = time.time()
-            expired = [pid for pid, p in state['parties'].items() if not p["members"] or (now - p["created"] > 600)]
-            for pid in expired:
-                del state['parties'][pid]
+            state['player_info'].pop(client_id, None)
+            del state['entity_ids'][client_id]
+            state['entities'].remove(entity_id)
     return handler
 
-async def start_server(state):
-    print("Server starting on ws://localhost:8765 ...", flush=True)
-    async with websockets.serve(make_handler(state), "localhost", 8765):
-        await asyncio.Future()  # run forever
+async def start_server(state, tick_rate=DEFAULT_TICK_RATE, host="localhost", port=8765):
+    log.info("Server starting on ws://%s:%d at %d ticks/s ...", host, port, tick_rate)
+    state['config']['tick_rate'] = tick_rate
+    register_gauges(state)
+    reaper = asyncio.create_task(party_reaper(state))
+    lag_probe = asyncio.create_task(loop_lag_probe(state['metrics']))
+    store = state['profiles']
+    flusher = asyncio.create_task(store.flusher()) if store is not None else None
+    pool = state['endgame_pool']
+    if pool is not None:
+        # Players finishing the campaign land at depth 1
+        pool.prefetch(1)
+    async with websockets.serve(make_handler(state), host, port):
+        try:
+            await tick_loop(state, tick_rate)  # run forever
+        finally:
+            reaper.cancel()
+            lag_probe.cancel()
+            if pool is not None:
+                pool.close()
+            if flusher is not None:
+                flusher.cancel()
+                await store.close()
@@ -0,0 +1,95 @@
+import json
+from shared.log import get_logger
+from shared.map import pack_grid
+from shared.protocol import DEFAULT_TICK_RATE, PROTOCOL_VERSION
+from .party import CAMPAIGN_ACTS, get_party_id, join_party, leave_party, next_progress, shard_for_party
+from .persistence import save_profile
+
+log = get_logger("server")
+
+def map_summary(party):
+    """Map metadata for the welcome message; on a cache miss the client streams the grid in chunks."""
+    summary = {k: v for k, v in party["map_data"].items() if k != "grid"}
+    summary["hash"] = party["map_hash"]
+    return summary
+
+def map_data_message(party):
+    if party["map_packed"] is None:
+        party["map_packed"] = pack_grid(party["map"])
+    return json.dumps({
+        "type": "map_data",
+        "payload": {
+            "hash": party["map_hash"],
+            "width": party["map"].width,
+            "height": party["map"].height,
+            "encoding": "zlib+base64",
+            "data": party["map_packed"]
+        }
+    })
+
+def welcome_message(state, client_id, party_id, codec):
+    """JSON welcome for a client that has just joined a party."""
+    party = state['parties'][party_id]
+    entity_id = state['entity_ids'][client_id]
+    return json.dumps({
+        "type": "welcome",
+        "sender": "server",
+        "payload": {
+            "client_id": client_id,
+            "entity_id": entity_id,
+            "protocol_version": PROTOCOL_VERSION,
+            "codec": codec,
+            "map": map_summary(party),
+            "act": party["act"],
+            "zone": party["zone"],
+            "boss": party["map_data"].get("boss"),
+            "player_info": state['player_info'][client_id],
+            "player_pos": state['entities'].pos(entity_id),
+            # Lets the client turn tick numbers into server time for interpolation
+            "tick_rate": state['config'].get('tick_rate', DEFAULT_TICK_RATE),
+            "tick": state['tick']
+        }
+    })
+
+def transfer_player(state, client_id):
+    """Move a client to the zone after its current one.
+
+    The client is re-welcomed into the new party in this process, or, when
+    parties are sharded and another worker owns the new party, told to
+    transfer and disconnected so the gateway can reconnect it there. If the
+    new party is an endgame depth whose map the pool hasn't finished yet, the
+    client stays in its current party and is marked pending; the tick retries
+    the transfer until the map is ready, so generation never runs in the tick.
+    Returns the new party id, or None if the client was handed off or is pending.
+    """
+    progress = next_progress(state['player_progress'][client_id])
+    party_id = get_party_id(progress["act"], progress["zone"], progress["endgame_depth"])
+    shard = state['config'].get('shard')
+    handoff = shard and shard_for_party(party_id, shard[1]) != shard[0]
+    pool = state['endgame_pool']
+    if (not handoff and pool is not None and progress["act"] > CAMPAIGN_ACTS
+            and party_id not in state['parties'] and not pool.has_ready(progress["endgame_depth"])):
+        # Also resubmits the map if its generation failed
+        pool.prefetch(progress["endgame_depth"])
+        if client_id not in state['pending_transfers']:
+            state['pending_transfers'].add(client_id)
+            state['metrics'].counter("transfers_deferred").inc()
+            log.info("Client %s waiting for the map of party %s.", client_id, party_id)
+        return None
+    state['player_progress'][client_id] = progress
+    save_profile(state, client_id)
+    leave_party(state, client_id)
+    out = state['outbound'][client_id]
+    if handoff:
+        log.info("Client %s handed off to worker %d for party %s.", client_id, shard_for_party(party_id, shard[1]), party_id)
+        profile_id = state['profile_ids'].get(client_id)
+        if profile_id is not None:
+            # The next worker loads this profile; our hot copy would go stale
+            state['profiles'].forget(profile_id)
+        out.send(json.dumps({"type": "transfer", "payload": progress}))
+        out.finish(reason="transfer")
+        return None
+    join_party(state, client_id)
+    log.info("Client %s moved to party %s.", client_id, party_id)
+    out.send(welcome_message(state, client_id, party_id, out.codec))
+    return party_id
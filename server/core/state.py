@@ -1,16 +1,36 @@
+from .entities import EntityStore
+from .metrics import Metrics
+
 def init_state():
     return {
         'connected_clients': {},
-        'player_states': {},
+        'outbound': {},
+        # Positions, hp, type and class ids of all players and monsters
+        'entities': EntityStore(),
+        # client_id -> entity id
+        'entity_ids': {},
         'player_progress': {},
         'parties': {},
+        # client_id -> party id the client is currently in
+        'player_party': {},
+        # Min-heap of (due_time, expiry_gen, party_id) for empty parties
+        'party_expiry': [],
         'player_xp': {},
-        'monsters': {},
+        # Persistent profile store (ProfileStore) or None, and client_id -> profile id
+        'profiles': None,
+        'profile_ids': {},
+        # EndgamePool of pregenerated endgame maps, or None to generate them on demand
+        'endgame_pool': None,
+        # Clients standing on an exit whose next endgame map is still being generated
+        'pending_transfers': set(),
+        'monsters': {},  # party_id -> list of monster entity ids
         'emotes': {},
-        'player_hp': {},
-        'player_max_hp': {},
         'player_info': {},
         'player_in_city': {},
+        'tick': 0,
+        'config': {},
+        # Counters, gauges and latency histograms served by the admin stats message
+        'metrics': Metrics(),
         'CITY_INSTANCE': {
             'map': None,
             'members': set()
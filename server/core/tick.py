@@ -0,0 +1,280 @@
+import asyncio
+import json
+import time
+from collections import deque
+from shared.map import EXIT, SUBTILES_PER_TILE
+from shared.log import get_logger
+from shared.protocol import DEFAULT_TICK_RATE, MONSTER_TYPES, MOVE_STEPS_PER_SECOND, encode_message
+from .aoi import INTEREST_RADIUS
+from .chunks import stream_chunks
+from .entities import KIND_MONSTER
+from .flowfield import MONSTER_STEP_TICKS
+from .session import transfer_player
+
+log = get_logger("server.tick")
+move_log = get_logger("server.move")
+
+def queue_move(state, party_id, client_id, pos):
+    """Record a move intent; only the latest intent per client is applied on the next tick."""
+    party = state['parties'].get(party_id)
+    if party is not None:
+        party["intents"][client_id] = pos
+
+def queue_path(state, party_id, client_id, seq, path):
+    """Record a path intent; the next tick splices it into the client's walk."""
+    party = state['parties'].get(party_id)
+    if party is not None:
+        party["path_intents"][client_id] = (seq, path)
+
+def _valid_position(game_map, x, y, sx, sy):
+    return (0 <= x < game_map.width and 0 <= y < game_map.height
+            and 0 <= sx < SUBTILES_PER_TILE and 0 <= sy < SUBTILES_PER_TILE
+            and game_map.walkable[y*game_map.stride + x])
+
+def _adjacent(a, b):
+    """True if b is one step from a: the next tile at the same subtile, or the next subtile in the same tile."""
+    if a[2] == b[2] and a[3] == b[3]:
+        return abs(a[0] - b[0]) + abs(a[1] - b[1]) == 1
+    return a[0] == b[0] and a[1] == b[1] and abs(a[2] - b[2]) + abs(a[3] - b[3]) == 1
+
+def send_correction(state, client_id, seq, pos):
+    """Tell a client its path was refused or cut short, and where it really is."""
+    out = state['outbound'].get(client_id)
+    if out:
+        out.send(json.dumps({"type": "correction", "payload": {"seq": seq, "pos": list(pos)}}))
+
+def apply_party_intents(state, party_id):
+    """Validate and apply queued move intents for a party. Returns the accepted moves."""
+    party = state['parties'][party_id]
+    intents = party["intents"]
+    if not intents:
+        return []
+    party["intents"] = {}
+    game_map = party["map"]
+    moves = []
+    for client_id, pos in intents.items():
+        if client_id not in party["members"]:
+            continue
+        try:
+            x, y, sx, sy = pos
+            valid = _valid_position(game_map, x, y, sx, sy)
+        except (TypeError, ValueError, IndexError):
+            # Malformed intents are refused at the socket; never let one abort the tick for everyone
+            valid = False
+        if valid:
+            eid = state['entity_ids'][client_id]
+            state['entities'].set_pos(eid, x, y, sx, sy)
+            party["aoi"].move(eid, x, y)
+            # A direct move replaces any path being walked
+            party["walks"].pop(client_id, None)
+            moves.append({"eid": eid, "client_id": client_id, "pos": [x, y, sx, sy]})
+            if game_map.cells[y*game_map.stride + x] == EXIT:
+                party["exits"].append(client_id)
+        else:
+            move_log.debug("Move rejected (malformed, out of bounds or not walkable) for %s: %s", client_id, pos)
+    return moves
+
+def accept_paths(state, party_id):
+    """Start or splice newly received paths into the members' walks.
+
+    A path starts where the client predicted it would be. If that is the
+    server position the walk restarts there; if it lies further along the
+    current walk, the walk is cut after it and continues with the new steps.
+    Anything else is refused with a correction.
+    """
+    party = state['parties'][party_id]
+    intents = party["path_intents"]
+    if not intents:
+        return
+    party["path_intents"] = {}
+    walks = party["walks"]
+    for client_id, (seq, path) in intents.items():
+        if client_id not in party["members"]:
+            continue
+        pos = tuple(state['entities'].pos(state['entity_ids'][client_id]))
+        start = tuple(path[0])
+        steps = [tuple(step) for step in path[1:]]
+        walk = walks.get(client_id)
+        if start == pos:
+            # A walk from standing still takes its first step on this tick
+            budget = walk["budget"] if walk else 1.0
+            walks[client_id] = {"seq": seq, "steps": deque(steps), "budget": budget}
+        elif walk and start in walk["steps"]:
+            ahead = list(walk["steps"])
+            walk["steps"] = deque(ahead[:ahead.index(start) + 1] + steps)
+            walk["seq"] = seq
+        else:
+            move_log.debug("Path %s from %s refused for %s at %s", seq, start, client_id, pos)
+            send_correction(state, client_id, seq, pos)
+
+def advance_walks(state, party_id, steps_per_tick):
+    """Move each walking member along its path at the fixed walking speed. Returns the resulting moves."""
+    party = state['parties'][party_id]
+    walks = party["walks"]
+    if not walks:
+        return []
+    game_map = party["map"]
+    entities = state['entities']
+    moves = []
+    for client_id in list(walks):
+        walk = walks[client_id]
+        eid = state['entity_ids'][client_id]
+        pos = tuple(entities.pos(eid))
+        walk["budget"] += steps_per_tick
+        moved = False
+        steps = walk["steps"]
+        while walk["budget"] >= 1.0 and steps:
+            step = steps[0]
+            if not (_adjacent(pos, step) and _valid_position(game_map, *step)):
+                move_log.debug("Path %s stopped for %s at %s (bad step %s)", walk["seq"], client_id, pos, step)
+                send_correction(state, client_id, walk["seq"], pos)
+                steps.clear()
+                break
+            steps.popleft()
+            walk["budget"] -= 1.0
+            pos = step
+            moved = True
+            if game_map.cells[pos[1]*game_map.stride + pos[0]] == EXIT:
+                party["exits"].append(client_id)
+                steps.clear()
+        if moved:
+            entities.set_pos(eid, *pos)
+            party["aoi"].move(eid, pos[0], pos[1])
+            moves.append({"eid": eid, "client_id": client_id, "pos": list(pos)})
+        if not steps:
+            del walks[client_id]
+    return moves
+
+def monster_record(entities, eid):
+    i = entities.slot[eid]
+    return {"eid": eid, "pos": [entities.x[i], entities.y[i]], "type": MONSTER_TYPES[entities.type_id[i]], "hp": entities.hp[i]}
+
+def move_monsters(state, party_id, tick):
+    """Step each monster one tile down the party's flow field towards the nearest player.
+
+    Returns the records of monsters that moved.
+    """
+    party = state['parties'][party_id]
+    if tick % MONSTER_STEP_TICKS or not party["members"]:
+        return []
+    entities = state['entities']
+    field = party["flow_field"]
+    field.update(entities.tile(eid) for eid in party["member_eids"])
+    slots = [entities.slot[eid] for eid in state['monsters'][party_id]]
+    xs, ys = entities.x, entities.y
+    occupied = {(xs[i], ys[i]) for i in slots}
+    moved = []
+    for i in slots:
+        x, y = xs[i], ys[i]
+        step = field.next_step(x, y, occupied)
+        if step:
+            occupied.discard((x, y))
+            occupied.add(step)
+            xs[i], ys[i] = step
+            eid = entities.ids[i]
+            party["aoi"].move(eid, step[0], step[1])
+            moved.append(monster_record(entities, eid))
+    return moved
+
+def _in_range(changes, nearby):
+    # Iterate whichever side is smaller
+    if len(changes) < len(nearby):
+        return [rec for eid, rec in changes.items() if eid in nearby]
+    return [changes[eid] for eid in nearby if eid in changes]
+
+def replicate_party(state, party_id, tick, moves, monster_moves=()):
+    """Queue this tick's update frame for each party member, limited to entities in its interest radius.
+
+    Entities entering a member's radius are sent in full, moves are sent only for
+    entities already in range, and entities leaving the radius are listed as removed.
+    """
+    party = state['parties'][party_id]
+    if not moves and not monster_moves and not party["aoi_dirty"]:
+        return
+    party["aoi_dirty"] = False
+    moved = {m["eid"]: m for m in moves}
+    moved_monsters = {m["eid"]: m for m in monster_moves}
+    aoi = party["aoi"]
+    entities = state['entities']
+    for client_id in party["members"]:
+        out = state['outbound'].get(client_id)
+        if not out:
+            continue
+        x, y = entities.tile(state['entity_ids'][client_id])
+        nearby = aoi.query(x, y, INTEREST_RADIUS)
+        visible = party["visible"].get(client_id, set())
+        frame_moves = _in_range(moved, nearby)
+        frame_monsters = _in_range(moved_monsters, nearby)
+        for eid in nearby - visible:
+            if eid in moved or eid in moved_monsters:
+                continue
+            if entities.kind[entities.slot[eid]] == KIND_MONSTER:
+                frame_monsters.append(monster_record(entities, eid))
+            else:
+                frame_moves.append({"eid": eid, "client_id": party["member_eids"][eid], "pos": entities.pos(eid)})
+        removed = list(visible - nearby)
+        party["visible"][client_id] = nearby
+        if frame_moves or frame_monsters or removed:
+            frame = {
+                "type": "tick",
+                "payload": {"tick": tick, "moves": frame_moves, "monsters": frame_monsters, "removed": removed}
+            }
+            out.send(encode_message(frame, out.codec), frame)
+
+def run_tick(state):
+    state['tick'] += 1
+    tick = state['tick']
+    metrics = state['metrics']
+    validate = metrics.histogram("validate", type="move")
+    simulate = metrics.histogram("simulate", system="monsters")
+    fanout = metrics.histogram("fanout", type="tick")
+    clock = time.perf_counter
+    steps_per_tick = MOVE_STEPS_PER_SECOND / state['config'].get('tick_rate', DEFAULT_TICK_RATE)
+    with metrics.time("tick"):
+        for party_id, party in state['parties'].items():
+            t0 = clock()
+            moves = apply_party_intents(state, party_id)
+            accept_paths(state, party_id)
+            moves += advance_walks(state, party_id, steps_per_tick)
+            t1 = clock()
+            monster_moves = move_monsters(state, party_id, tick)
+            t2 = clock()
+            dirty = moves or monster_moves or party["aoi_dirty"]
+            replicate_party(state, party_id, tick, moves, monster_moves)
+            if moves and party["chunk_streams"]:
+                stream_chunks(state, party_id, moves)
+            t3 = clock()
+            if moves:
+                validate.record((t1 - t0) * 1_000_000)
+            if monster_moves:
+                simulate.record((t2 - t1) * 1_000_000)
+            if dirty:
+                fanout.record((t3 - t2) * 1_000_000)
+        # Zone changes join or create parties, so they run after the party sweep
+        for party in list(state['parties'].values()):
+            if party["exits"]:
+                exits, party["exits"] = party["exits"], []
+                for client_id in exits:
+                    if client_id in party["members"]:
+                        transfer_player(state, client_id)
+        # Transfers waiting on an endgame map go ahead once the pool has it
+        for client_id in list(state['pending_transfers']):
+            transfer_player(state, client_id)
+
+async def tick_loop(state, tick_rate=DEFAULT_TICK_RATE):
+    """Run the simulation at a fixed rate, skipping ahead rather than bursting when behind."""
+    interval = 1.0 / tick_rate
+    next_tick = time.monotonic()
+    while True:
+        try:
+            run_tick(state)
+        except Exception:
+            log.exception("Tick %d failed", state['tick'])
+        next_tick += interval
+        delay = next_tick - time.monotonic()
+        if delay < 0:
+            # Fell behind by more than a tick; resynchronise instead of running a burst of ticks
+            state['metrics'].counter("tick_overruns").inc()
+            next_tick = time.monotonic()
+            delay = 0
+        await asyncio.sleep(delay)
@@ -2,17 +2,137 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import argparse
 import asyncio
+import multiprocessing
+import signal
+import time
 from core.server import start_server
 from core.state import init_state
+from shared.log import get_logger, setup_logging
+from core.gateway import WORKER_BASE_PORT, Gateway, start_gateway
+from core.party import CAMPAIGN_ACTS, EMPTY_PARTY_GRACE, get_party_id, shard_for_party
+from core.persistence import ProfileStore
+from core.pregen import POOL_MAPS_PER_DEPTH, POOL_WORKERS, EndgamePool
+from core.tick import DEFAULT_TICK_RATE
 
-async def main():
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'profiles.sqlite3')
+# Seconds child processes get to flush profiles and exit on shutdown before they are killed
+CHILD_EXIT_TIMEOUT = 5.0
+
+log = get_logger("server")
+
+def open_store(args):
+    if not args.db:
+        return None
+    os.makedirs(os.path.dirname(os.path.abspath(args.db)), exist_ok=True)
+    return ProfileStore(args.db)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Isometric roguelike server")
+    parser.add_argument("--tick-rate", type=int, default=DEFAULT_TICK_RATE, help="simulation ticks per second")
+    parser.add_argument("--party-grace", type=float, default=EMPTY_PARTY_GRACE, help="seconds an empty party instance is kept")
+    parser.add_argument("--allow-zone-select", action="store_true", help="let class_select pick the act/zone (for load testing)")
+    parser.add_argument("--workers", type=int, default=0, help="shard parties across this many worker processes behind a gateway")
+    parser.add_argument("--worker", type=int, default=None, help="run only this worker of --workers (no gateway)")
+    parser.add_argument("--gateway-only", action="store_true", help="run only the gateway of --workers")
+    parser.add_argument("--gateways", type=int, default=1, help="gateway processes sharing the public port (SO_REUSEPORT)")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="SQLite file for player profiles; empty to disable persistence")
+    parser.add_argument("--endgame-pool", type=int, default=POOL_MAPS_PER_DEPTH, help="endgame maps pregenerated per depth; 0 generates on demand")
+    parser.add_argument("--pregen-workers", type=int, default=POOL_WORKERS, help="processes generating endgame maps")
+    parser.add_argument("--worker-port", type=int, default=WORKER_BASE_PORT, help="port of worker 0; worker i uses this + i")
+    return parser.parse_args()
+
+def open_endgame_pool(args, shard=None):
+    if args.endgame_pool <= 0:
+        return None
+    owns = None
+    if shard is not None:
+        index, count = shard
+        owns = lambda depth: shard_for_party(get_party_id(CAMPAIGN_ACTS + 1, 1, depth), count) == index
+    return EndgamePool(maps_per_depth=args.endgame_pool, workers=args.pregen_workers, owns=owns)
+
+def stop_on_sigterm():
+    """Stop on SIGTERM the same way as on Ctrl+C, so shutdown cleanup (profile flushes, workers) runs."""
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass  # Windows
+
+async def run_server(args, shard=None, port=8765):
+    stop_on_sigterm()
     state = init_state()
-    await start_server(state)
+    state['config']['party_grace'] = args.party_grace
+    state['config']['allow_zone_select'] = args.allow_zone_select
+    state['profiles'] = open_store(args)
+    if shard is not None:
+        # Workers sit behind the gateway, which picks the zone for each session
+        state['config']['shard'] = shard
+        state['config']['allow_zone_select'] = True
+    state['endgame_pool'] = open_endgame_pool(args, shard)
+    await start_server(state, tick_rate=args.tick_rate, port=port)
+
+def make_gateway(args):
+    return Gateway(args.workers, base_port=args.worker_port, allow_zone_select=args.allow_zone_select, store=open_store(args))
+
+def run_gateway(args):
+    setup_logging("server")
+    try:
+        asyncio.run(start_gateway(make_gateway(args), reuse_port=True))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+def run_worker(args, index):
+    setup_logging("server")
+    try:
+        asyncio.run(run_server(args, shard=(index, args.workers), port=args.worker_port + index))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+def stop_children(children):
+    """SIGTERM the worker and gateway processes and wait for them to flush and exit, killing stragglers."""
+    for proc in children:
+        proc.terminate()
+    deadline = time.monotonic() + CHILD_EXIT_TIMEOUT
+    for proc in children:
+        proc.join(max(0.0, deadline - time.monotonic()))
+        if proc.is_alive():
+            log.warning("Process %s did not exit, killing it", proc.name)
+            proc.kill()
+            proc.join()
+
+async def serve(args):
+    setup_logging("server")
+    if not args.workers:
+        await run_server(args)
+        return
+    # Spawned rather than forked so each child starts its own logging thread. Not daemonic:
+    # workers start their own endgame pregeneration processes, which daemonic processes may not
+    context = multiprocessing.get_context("spawn")
+    children = []
+    if not args.gateway_only:
+        for i in range(args.workers):
+            children.append(context.Process(target=run_worker, args=(args, i)))
+    for _ in range(args.gateways - 1):
+        children.append(context.Process(target=run_gateway, args=(args,)))
+    for proc in children:
+        proc.start()
+    stop_on_sigterm()
+    try:
+        await start_gateway(make_gateway(args), reuse_port=args.gateways > 1)
+    finally:
+        stop_children(children)
+
+def main():
+    args = parse_args()
+    if args.worker is not None:
+        run_worker(args, args.worker)
+    else:
+        asyncio.run(serve(args))
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
+        main()
+    except (KeyboardInterrupt, asyncio.CancelledError):
         print("[SERVER] Shutting down gracefully.")
         sys.exit(0)
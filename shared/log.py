@@ -0,0 +1,114 @@
+# shared/log.py
+"""
+Logging setup shared by client and server.
+
+Loggers are named by category ("server.net", "client.input", ...). Records
+below WARNING can be sampled per category so high-frequency events only log
+one in N. Records are handed to a queue without being formatted; a background
+listener thread formats them, writes them to stdout and keeps the most recent
+ones in an in-memory ring buffer that can be dumped on demand.
+
+Configure with ISO_LOG_LEVEL (e.g. DEBUG) and ISO_LOG_SAMPLE
+(e.g. "server.net=100,client.net=50"). Debug calls cost a level check when
+debug logging is off, so use %-style arguments rather than f-strings.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import signal
+import sys
+from collections import deque
+
+LOG_FORMAT = "%(asctime)s [%(name)s] %(levelname)s %(message)s"
+RING_BUFFER_SIZE = 2000
+
+_listener = None
+_ring = None
+
+def get_logger(category):
+    return logging.getLogger(category)
+
+class SampleFilter(logging.Filter):
+    """Let one in every N records through for each sampled category; WARNING and above always pass."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self.counts = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        n = self.rates.get(record.name)
+        if not n or n <= 1:
+            return True
+        count = self.counts.get(record.name, 0)
+        self.counts[record.name] = count + 1
+        return count % n == 0
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # Hand the record over as-is; message formatting happens on the listener thread
+    def prepare(self, record):
+        return record
+
+class RingBufferHandler(logging.Handler):
+    """Keeps the last `capacity` formatted records in memory."""
+
+    def __init__(self, capacity=RING_BUFFER_SIZE):
+        super().__init__()
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.records.append(self.format(record))
+
+    def dump(self, stream=None):
+        stream = stream or sys.stderr
+        for line in list(self.records):
+            stream.write(line + "\n")
+        stream.flush()
+
+def parse_sample_rates(spec):
+    """Parse "category=N,category=N" into a dict."""
+    rates = {}
+    for part in (spec or "").split(","):
+        if "=" in part:
+            name, n = part.split("=", 1)
+            rates[name.strip()] = int(n)
+    return rates
+
+def setup_logging(root, level=None, sample_rates=None):
+    """Route every logger under `root` through the background queue. Safe to call once per process."""
+    global _listener, _ring
+    if _listener is not None:
+        return
+    level = level or os.environ.get("ISO_LOG_LEVEL", "INFO")
+    if sample_rates is None:
+        sample_rates = parse_sample_rates(os.environ.get("ISO_LOG_SAMPLE"))
+    formatter = logging.Formatter(LOG_FORMAT)
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(formatter)
+    _ring = RingBufferHandler()
+    _ring.setFormatter(formatter)
+    records = queue.SimpleQueue()
+    handler = _DeferredQueueHandler(records)
+    handler.addFilter(SampleFilter(sample_rates))
+    logger = logging.getLogger(root)
+    logger.setLevel(level)
+    logger.addHandler(handler)
+    logger.propagate = False
+    _listener = logging.handlers.QueueListener(records, stream, _ring)
+    _listener.start()
+    atexit.register(_listener.stop)
+    if hasattr(signal, "SIGUSR1"):
+        try:
+            signal.signal(signal.SIGUSR1, lambda signum, frame: dump_ring_buffer())
+        except ValueError:
+            pass  # not on the main thread
+
+def dump_ring_buffer(stream=None):
+    """Write the most recent log records to `stream` (stderr by default)."""
+    if _ring is not None:
+        _ring.dump(stream)
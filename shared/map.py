@@ -3,7 +3,12 @@
 Map representation and utilities for the isometric roguelike game.
 """
 
+import base64
+import hashlib
 import random
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
 
 # Tile codes
 FLOOR = 0
@@ -18,38 +23,274 @@ TILE_NAMES = {
 
 MAX_MAP_SIZE = 256
 
+# Maps are streamed to clients in square chunks of this many tiles per side
+CHUNK_SIZE = 32
+
+# Each tile is subdivided into 3x3 sub-tiles for fine movement
+SUBTILES_PER_TILE = 3
+
+# Tiles players can stand on (see maps_campaign.is_walkable_tile)
+WALKABLE_TILES = (FLOOR, EXIT)
+# bytes.translate table mapping a tile code to 1 if walkable, else 0
+_WALKABLE_TABLE = bytes(1 if t in WALKABLE_TILES else 0 for t in range(256))
+
 class GameMap:
-    def __init__(self, width, height):
+    """Tile map stored as a packed row-major bytearray (one byte per tile).
+
+    `walkable` is a precomputed mask with the same layout (1 = walkable), so
+    per-cell checks are a single index. `grid` is still available as a list of
+    rows for existing callers; it is rebuilt lazily after writes, and writes
+    must go through set_tile or by assigning a whole new grid.
+    """
+
+    def __init__(self, width, height, generate=True):
         self.width = min(width, MAX_MAP_SIZE)
         self.height = min(height, MAX_MAP_SIZE)
-        self.grid = [[FLOOR for _ in range(self.width)] for _ in range(self.height)]
-        self.generate_walls_and_exits()
+        self.stride = self.width
+        self.cells = bytearray(self.width * self.height)  # all FLOOR
+        self.walkable = self.cells.translate(_WALKABLE_TABLE)
+        self._rows = None
+        self._subtile_walkable = None
+        self._walkable_cells = None
+        self.chunks_x = -(-self.width // CHUNK_SIZE)
+        self.chunks_y = -(-self.height // CHUNK_SIZE)
+        # Per-chunk version, row-major; bumped whenever a tile in the chunk changes
+        self.chunk_versions = array('I', [1]) * (self.chunks_x * self.chunks_y)
+        if generate:
+            self.generate_walls_and_exits()
+
+    @classmethod
+    def from_grid(cls, grid):
+        """Build a map from a list of rows, e.g. the static campaign and city maps."""
+        game_map = cls(len(grid[0]) if grid else 0, len(grid), generate=False)
+        game_map.grid = grid
+        return game_map
+
+    @property
+    def grid(self):
+        if self._rows is None:
+            cells, w = self.cells, self.stride
+            self._rows = [list(cells[y*w:(y+1)*w]) for y in range(self.height)]
+        return self._rows
+
+    @grid.setter
+    def grid(self, grid):
+        w = self.stride
+        cells = bytearray(w * self.height)
+        for y, row in enumerate(grid[:self.height]):
+            cells[y*w:y*w+len(row[:w])] = bytes(row[:w])
+        self.cells = cells
+        self._changed()
+
+    @classmethod
+    def filled(cls, width, height, tile):
+        """A map of one tile everywhere, e.g. all WALL as a client's stand-in for chunks it hasn't received."""
+        game_map = cls(width, height, generate=False)
+        game_map.cells = bytearray([tile]) * (game_map.width * game_map.height)
+        game_map._changed()
+        return game_map
+
+    def _changed(self):
+        """Rebuild derived data after all cells were replaced; every chunk gets a new version."""
+        self.walkable = self.cells.translate(_WALKABLE_TABLE)
+        self._rows = None
+        self._subtile_walkable = None
+        self._walkable_cells = None
+        for i in range(len(self.chunk_versions)):
+            self.chunk_versions[i] += 1
+
+    def get_tile(self, x, y):
+        return self.cells[y*self.stride + x]
+
+    def set_tile(self, x, y, tile):
+        i = y*self.stride + x
+        self.cells[i] = tile
+        self.walkable[i] = _WALKABLE_TABLE[tile]
+        if self._rows is not None:
+            self._rows[y][x] = tile
+        self._subtile_walkable = None
+        self._walkable_cells = None
+        self.chunk_versions[(y // CHUNK_SIZE) * self.chunks_x + x // CHUNK_SIZE] += 1
+
+    def chunk_bounds(self, cx, cy):
+        """Tile rectangle (x, y, width, height) of a chunk; edge chunks may be smaller."""
+        x, y = cx * CHUNK_SIZE, cy * CHUNK_SIZE
+        return x, y, min(CHUNK_SIZE, self.width - x), min(CHUNK_SIZE, self.height - y)
+
+    def chunk_cells(self, cx, cy):
+        """A chunk's tiles as bytes, row by row."""
+        x, y, w, h = self.chunk_bounds(cx, cy)
+        cells, stride = self.cells, self.stride
+        return b"".join(cells[(y + j)*stride + x:(y + j)*stride + x + w] for j in range(h))
+
+    def set_chunk_cells(self, cx, cy, data):
+        """Overwrite a chunk's tiles with bytes laid out as chunk_cells returns them.
+
+        Only the chunk's part of the walkable mask is updated, and `grid` rows
+        are patched in place, so holders of the grid see the new tiles.
+        """
+        x, y, w, h = self.chunk_bounds(cx, cy)
+        if len(data) != w * h:
+            raise ValueError(f"Chunk ({cx}, {cy}) has {len(data)} cells, expected {w}x{h}")
+        data = bytes(data)
+        stride, rows = self.stride, self._rows
+        for j in range(h):
+            row = data[j*w:(j + 1)*w]
+            start = (y + j)*stride + x
+            self.cells[start:start + w] = row
+            self.walkable[start:start + w] = row.translate(_WALKABLE_TABLE)
+            if rows is not None:
+                rows[y + j][x:x + w] = row
+        self._subtile_walkable = None
+        self._walkable_cells = None
+        self.chunk_versions[cy * self.chunks_x + cx] += 1
 
     def generate_walls_and_exits(self):
         # Simple random walls and one exit for demo
+        cells, w = self.cells, self.stride
         for y in range(self.height):
             for x in range(self.width):
                 if x == 0 or y == 0 or x == self.width-1 or y == self.height-1:
-                    self.grid[y][x] = WALL
+                    cells[y*w + x] = WALL
                 elif random.random() < 0.1:
-                    self.grid[y][x] = WALL
+                    cells[y*w + x] = WALL
         # Place an exit in a random location on the edge
         edge = random.choice([0, self.width-1])
-        self.grid[random.randint(1, self.height-2)][edge] = EXIT
+        cells[random.randint(1, self.height-2)*w + edge] = EXIT
+        self._changed()
 
     def is_walkable(self, x, y):
         if 0 <= x < self.width and 0 <= y < self.height:
-            return self.grid[y][x] != WALL
+            return self.cells[y*self.stride + x] != WALL
         return False
 
     def is_exit(self, x, y):
         if 0 <= x < self.width and 0 <= y < self.height:
-            return self.grid[y][x] == EXIT
+            return self.cells[y*self.stride + x] == EXIT
         return False
 
+    def is_walkable_tile(self, x, y):
+        """True if (x, y) is in bounds and a floor or exit tile."""
+        return 0 <= x < self.width and 0 <= y < self.height and self.walkable[y*self.stride + x] == 1
+
+    def is_walkable_subtile(self, x, y, sx, sy):
+        """True if the subtile is in bounds and its parent tile is walkable."""
+        return (0 <= sx < SUBTILES_PER_TILE and 0 <= sy < SUBTILES_PER_TILE
+                and 0 <= x < self.width and 0 <= y < self.height
+                and self.walkable[y*self.stride + x] == 1)
+
+    @property
+    def subtile_walkable(self):
+        """Walkability mask at subtile resolution, row-major with stride width * SUBTILES_PER_TILE.
+
+        Subtiles currently inherit their parent tile's walkability; the view is built
+        on first use for consumers that work in subtile space.
+        """
+        if self._subtile_walkable is None:
+            s = SUBTILES_PER_TILE
+            w = self.stride
+            mask = bytearray()
+            for y in range(self.height):
+                row = bytearray()
+                for v in self.walkable[y*w:(y+1)*w]:
+                    row += bytes((v,)) * s
+                mask += bytes(row) * s
+            self._subtile_walkable = mask
+        return self._subtile_walkable
+
+    @property
+    def walkable_cells(self):
+        """Sorted flat indices (y * stride + x) of every walkable tile, built once per map."""
+        if self._walkable_cells is None:
+            walkable = self.walkable
+            cells = array('I')
+            i = walkable.find(1)
+            while i != -1:
+                cells.append(i)
+                i = walkable.find(1, i + 1)
+            self._walkable_cells = cells
+        return self._walkable_cells
+
+    def _require_walkable(self):
+        if not self.walkable_cells:
+            raise ValueError(f"Map ({self.width}x{self.height}) has no walkable tiles")
+
+    def first_walkable_cell(self):
+        """The walkable tile with the lowest (y, x), as (x, y)."""
+        self._require_walkable()
+        i = self.walkable_cells[0]
+        return i % self.stride, i // self.stride
+
+    def random_walkable_cell(self, rng=random):
+        """A uniformly random walkable tile, as (x, y)."""
+        self._require_walkable()
+        i = self.walkable_cells[rng.randrange(len(self.walkable_cells))]
+        return i % self.stride, i // self.stride
+
+    def walkable_cells_in_region(self, x0, y0, x1, y1):
+        """Walkable tiles with x0 <= x <= x1 and y0 <= y <= y1, as a list of (x, y)."""
+        cells, w = self.walkable_cells, self.stride
+        x0, x1 = max(x0, 0), min(x1, self.width - 1)
+        found = []
+        for y in range(max(y0, 0), min(y1, self.height - 1) + 1):
+            lo = bisect_left(cells, y*w + x0)
+            hi = bisect_right(cells, y*w + x1)
+            found.extend((i - y*w, y) for i in cells[lo:hi])
+        return found
+
+    def nearest_walkable_cell(self, x, y):
+        """The walkable tile closest to (x, y) by Chebyshev distance (searched in growing rings), as (x, y)."""
+        self._require_walkable()
+        if self.is_walkable_tile(x, y):
+            return x, y
+        for r in range(1, max(self.width, self.height) + 1):
+            # Top and bottom edges of the ring, then its left and right sides
+            ring = self.walkable_cells_in_region(x - r, y - r, x + r, y - r)
+            ring += self.walkable_cells_in_region(x - r, y + r, x + r, y + r)
+            for cy in range(y - r + 1, y + r):
+                for cx in (x - r, x + r):
+                    if self.is_walkable_tile(cx, cy):
+                        ring.append((cx, cy))
+            if ring:
+                return min(ring, key=lambda c: (c[1], c[0]))
+        raise ValueError(f"No walkable tile near ({x}, {y})")
+
     def to_dict(self):
         return {
             "width": self.width,
             "height": self.height,
             "grid": self.grid
         }
+
+def _grid_bytes(grid):
+    if isinstance(grid, GameMap):
+        return grid.width, grid.height, bytes(grid.cells)
+    width = len(grid[0]) if grid else 0
+    return width, len(grid), b"".join(bytes(row) for row in grid)
+
+def map_hash(grid):
+    """Content hash of a tile grid (list of rows or GameMap); identical maps hash the same on client and server."""
+    width, height, cells = _grid_bytes(grid)
+    return hashlib.sha1(width.to_bytes(2, "little") + height.to_bytes(2, "little") + cells).hexdigest()
+
+def pack_grid(grid):
+    """Compress a tile grid (list of rows or GameMap) to a base64 string for JSON transport."""
+    return base64.b64encode(zlib.compress(_grid_bytes(grid)[2])).decode("ascii")
+
+def chunk_of(x, y):
+    """Chunk coordinates of the chunk holding tile (x, y)."""
+    return x // CHUNK_SIZE, y // CHUNK_SIZE
+
+def pack_cells(cells):
+    """Compress raw tile bytes (e.g. GameMap.chunk_cells) to a base64 string for JSON transport."""
+    return base64.b64encode(zlib.compress(cells)).decode("ascii")
+
+def unpack_cells(data):
+    return zlib.decompress(base64.b64decode(data))
+
+def unpack_grid(data, width, height):
+    """Inverse of pack_grid."""
+    raw = zlib.decompress(base64.b64decode(data))
+    if len(raw) != width * height:
+        raise ValueError(f"Packed grid has {len(raw)} cells, expected {width}x{height}")
+    return [list(raw[y*width:(y+1)*width]) for y in range(height)]
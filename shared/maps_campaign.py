@@ -5,6 +5,8 @@ Each act has 10 zones, with a boss in the 10th zone.
 The theme is 'Imperial American' with comically evil supervillains.
 """
 
+from shared.map import GameMap, SUBTILES_PER_TILE
+
 # Tile codes: 0 = floor, 1 = wall, 2 = exit, 3 = boss
 
 # Example: Each act/zone is a simple room, boss room is special
@@ -122,11 +124,12 @@ def boss_zone():
         "boss": True
     }
 
-# Each tile is subdivided into 3x3 sub-tiles for fine movement
-SUBTILES_PER_TILE = 3
+# Each tile is subdivided into 3x3 sub-tiles for fine movement (SUBTILES_PER_TILE, defined in shared.map)
 
 def is_walkable_tile(grid, x, y):
-    """Return True if the tile at (x, y) is walkable (floor or exit)."""
+    """Return True if the tile at (x, y) is walkable (floor or exit). `grid` may be a GameMap or a list of rows."""
+    if isinstance(grid, GameMap):
+        return grid.is_walkable_tile(x, y)
     if 0 <= y < len(grid) and 0 <= x < len(grid[0]):
         return grid[y][x] in (0, 2)
     return False
@@ -137,6 +140,8 @@ def get_subtile_positions(x, y):
 
 def is_walkable_subtile(grid, x, y, sx, sy):
     """Return True if the subtile at (x, y, sx, sy) is walkable (parent tile is floor or exit)."""
+    if isinstance(grid, GameMap):
+        return grid.is_walkable_subtile(x, y, sx, sy)
     return is_walkable_tile(grid, x, y)
 
 # Example usage: get_subtile_positions(3, 4) returns all 9 sub-tile positions in tile (3,4)
@@ -1,33 +1,153 @@
-# Endgame procedural map generation skeleton for isometric roguelike
-# This module will provide functions to generate random dungeon maps for the endgame dive.
-# Actual generation logic will be implemented later.
+# Endgame procedural map generation for isometric roguelike
+# Endgame dive maps are generated per depth: BSP-partitioned rooms joined by
+# corridors, with more and more of the partitions grown as cellular-automata
+# caves the deeper the dive goes.
 
 import random
+from collections import deque
+from shared.map import MAX_MAP_SIZE
 
 ENDGAME_TILE_FLOOR = 0
 ENDGAME_TILE_WALL = 1
 ENDGAME_TILE_EXIT = 2
 
+# Map side at depth 1 and its growth per depth, up to MAX_MAP_SIZE
+ENDGAME_BASE_SIZE = 48
+ENDGAME_SIZE_PER_DEPTH = 8
+# Smallest BSP partition side; each partition holds one room or cave
+BSP_MIN_LEAF = 10
+# Share of partitions that become caves at depth 1, its growth per depth, and its cap
+CAVE_CHANCE = 0.15
+CAVE_CHANCE_PER_DEPTH = 0.05
+MAX_CAVE_CHANCE = 0.75
+# Cave seeding density and smoothing passes (a cell becomes wall with 5+ walls in its 3x3 block)
+CAVE_FILL = 0.45
+CAVE_STEPS = 4
 
-def generate_endgame_map(depth=1, width=12, height=12):
+def endgame_map_size(depth):
+    return min(MAX_MAP_SIZE, ENDGAME_BASE_SIZE + ENDGAME_SIZE_PER_DEPTH * (max(1, depth) - 1))
+
+def _split(rng, x, y, w, h, leaves):
+    """Recursively cut the rectangle in two until partitions are too small to cut, collecting them in tree order."""
+    can_cut_x = w >= 2 * BSP_MIN_LEAF
+    can_cut_y = h >= 2 * BSP_MIN_LEAF
+    if not (can_cut_x or can_cut_y):
+        leaves.append((x, y, w, h))
+        return
+    if can_cut_x and (not can_cut_y or w > h or (w == h and rng.random() < 0.5)):
+        cut = rng.randint(BSP_MIN_LEAF, w - BSP_MIN_LEAF)
+        _split(rng, x, y, cut, h, leaves)
+        _split(rng, x + cut, y, w - cut, h, leaves)
+    else:
+        cut = rng.randint(BSP_MIN_LEAF, h - BSP_MIN_LEAF)
+        _split(rng, x, y, w, cut, leaves)
+        _split(rng, x, y + cut, w, h - cut, leaves)
+
+def _carve_rect(cells, stride, x, y, w, h):
+    row = bytes(w)  # FLOOR
+    for yy in range(y, y + h):
+        cells[yy*stride + x:yy*stride + x + w] = row
+
+def _room(rng, cells, stride, x, y, w, h):
+    """Carve a rectangular room inside a partition, leaving a wall margin. Returns its centre."""
+    if w < 5 or h < 5:
+        _carve_rect(cells, stride, x, y, w, h)
+        return x + w // 2, y + h // 2
+    rw = rng.randint(max(3, w // 2), w - 2)
+    rh = rng.randint(max(3, h // 2), h - 2)
+    rx = x + rng.randint(1, w - rw - 1)
+    ry = y + rng.randint(1, h - rh - 1)
+    _carve_rect(cells, stride, rx, ry, rw, rh)
+    return rx + rw // 2, ry + rh // 2
+
+def _cave(rng, cells, stride, x, y, w, h):
+    """Grow a cave inside a partition with a few cellular-automata smoothing passes. Returns its centre.
+
+    Each pass counts walls per 3x3 block with whole-row sums over a padded
+    grid (horizontal triples, then vertical triples), rather than visiting
+    the eight neighbours of every cell.
     """
-    Generate a random dungeon map for the endgame dive.
-    Difficulty and complexity should increase with depth.
-    For now, returns a simple empty map with walls around the edge and a single exit.
+    fill = CAVE_FILL
+    random_ = rng.random
+    # 1 = wall, padded with a wall border so the cave stays inside the partition
+    border = [1] * (w + 2)
+    rows = [border] + [[1] + [1 if random_() < fill else 0 for _ in range(w)] + [1] for _ in range(h)] + [border]
+    for _ in range(CAVE_STEPS):
+        triples = [[a + b + c for a, b, c in zip(row, row[1:], row[2:])] for row in rows]
+        rows = [border] + [
+            [1] + [1 if a + b + c >= 5 else 0 for a, b, c in zip(up, mid, down)] + [1]
+            for up, mid, down in zip(triples, triples[1:], triples[2:])
+        ] + [border]
+    for j in range(h):
+        start = (y + j) * stride + x
+        cells[start:start + w] = bytes(rows[j + 1][1:w + 1])
+    # Keep the centre open so the corridors have somewhere to land
+    cx, cy = x + w // 2, y + h // 2
+    _carve_rect(cells, stride, max(x, cx - 1), max(y, cy - 1), min(3, w), min(3, h))
+    return cx, cy
+
+def _corridor(rng, cells, stride, a, b):
+    """L-shaped one-tile corridor between two points, turning at a random corner."""
+    (ax, ay), (bx, by) = a, b
+    corner = (bx, ay) if rng.random() < 0.5 else (ax, by)
+    for (x0, y0), (x1, y1) in ((a, corner), (corner, b)):
+        if y0 == y1:
+            _carve_rect(cells, stride, min(x0, x1), y0, abs(x1 - x0) + 1, 1)
+        else:
+            _carve_rect(cells, stride, x0, min(y0, y1), 1, abs(y1 - y0) + 1)
+
+def _reachable(cells, width, height, start):
+    """Breadth-first flood fill over floor from `start`. Returns (visited mask, farthest cell index)."""
+    visited = bytearray(width * height)
+    first = start[1] * width + start[0]
+    visited[first] = 1
+    queue = deque((first,))
+    farthest = first
+    while queue:
+        i = queue.popleft()
+        farthest = i
+        x = i % width
+        for n in (i - width, i + width, i - 1 if x > 0 else -1, i + 1 if x < width - 1 else -1):
+            if 0 <= n < len(cells) and not visited[n] and cells[n] == ENDGAME_TILE_FLOOR:
+                visited[n] = 1
+                queue.append(n)
+    return visited, farthest
+
+def generate_endgame_map(depth=1, width=None, height=None, seed=None):
+    """
+    Generate a dungeon map for the endgame dive.
+
+    Maps grow with depth (see endgame_map_size) and more of their rooms become
+    caves. The same depth, size and seed always give the same map; the seed
+    defaults to the depth. Everything not reachable from the first room is
+    walled in, and the exit is placed on the reachable tile farthest from it.
     """
-    grid = [[ENDGAME_TILE_FLOOR for _ in range(width)] for _ in range(height)]
-    # Add walls around the edge
-    for y in range(height):
-        for x in range(width):
-            if x == 0 or y == 0 or x == width-1 or y == height-1:
-                grid[y][x] = ENDGAME_TILE_WALL
-    # Place an exit at bottom right
-    grid[height-2][width-2] = ENDGAME_TILE_EXIT
+    width = min(width or endgame_map_size(depth), MAX_MAP_SIZE)
+    height = min(height or endgame_map_size(depth), MAX_MAP_SIZE)
+    seed = depth if seed is None else seed
+    rng = random.Random(f"endgame:{depth}:{seed}")
+    cells = bytearray([ENDGAME_TILE_WALL]) * (width * height)
+    leaves = []
+    _split(rng, 1, 1, width - 2, height - 2, leaves)
+    cave_chance = min(MAX_CAVE_CHANCE, CAVE_CHANCE + CAVE_CHANCE_PER_DEPTH * (depth - 1))
+    centres = []
+    for i, (x, y, w, h) in enumerate(leaves):
+        # The first partition is always a room: it is where the exit distance is measured from
+        carve = _cave if i and rng.random() < cave_chance else _room
+        centres.append(carve(rng, cells, width, x, y, w, h))
+    # Leaves are in BSP order, so consecutive leaves are neighbours; chaining them connects the map
+    for a, b in zip(centres, centres[1:]):
+        _corridor(rng, cells, width, a, b)
+    visited, farthest = _reachable(cells, width, height, centres[0])
+    # Wall in cave pockets the corridors missed
+    cells = bytearray(c if v else ENDGAME_TILE_WALL for c, v in zip(cells, visited))
+    cells[farthest] = ENDGAME_TILE_EXIT
     return {
-        "grid": grid,
+        "grid": [list(cells[y*width:(y+1)*width]) for y in range(height)],
         "width": width,
         "height": height,
         "depth": depth,
+        "seed": seed,
         "city": False,
         "endgame": True
     }
@@ -0,0 +1,144 @@
+# shared/protocol.py
+"""
+Wire protocol shared by client and server.
+
+Messages are dicts of the form {"type": ..., "payload": {...}}. JSON text frames
+are always understood; hot-path messages (moves, paths and per-tick state
+frames) can instead be sent as fixed-layout binary frames once both sides agree
+on the binary codec during class selection. Binary frames identify players and
+monsters by small integer entity ids instead of UUID strings.
+"""
+
+import json
+import struct
+
+PROTOCOL_VERSION = 1
+
+CODEC_BINARY = "bin1"
+CODEC_JSON = "json"
+# In order of preference
+SUPPORTED_CODECS = (CODEC_BINARY, CODEC_JSON)
+
+# Binary message type ids
+MSG_MOVE = 1  # client -> server: requested position
+MSG_TICK = 2  # server -> client: per-tick state frame
+MSG_PATH = 3  # client -> server: path to walk, starting at the client's current position
+
+# Server simulation rate (ticks per second) unless configured otherwise; tick
+# frames are stamped with the tick number, so tick / tick_rate is server time
+DEFAULT_TICK_RATE = 20
+# Walking speed in (sub)tile steps per second; the server advances paths at this
+# rate and clients predict their own movement with it
+MOVE_STEPS_PER_SECOND = 8
+# Longest path accepted in one path message
+MAX_PATH_STEPS = 1024
+
+MONSTER_TYPES = ("goblin", "skeleton", "slime")
+MONSTER_TYPE_IDS = {name: i for i, name in enumerate(MONSTER_TYPES)}
+
+_HEADER = struct.Struct("<BB")               # version, message type
+_MOVE = struct.Struct("<BBHHBB")             # header, x, y, sx, sy
+_TICK_HEADER = struct.Struct("<BBIHHH")      # header, tick, players, monsters, removed
+_PLAYER = struct.Struct("<HHHBB")            # entity id, x, y, sx, sy
+_MONSTER = struct.Struct("<HHHBH")           # entity id, x, y, type id, hp
+_REMOVED = struct.Struct("<H")               # entity id
+_PATH_HEADER = struct.Struct("<BBHH")        # header, sequence number, step count
+_STEP = struct.Struct("<HHBB")               # x, y, sx, sy
+
+def negotiate_codec(offered):
+    """Pick the preferred codec that the peer offered, falling back to JSON."""
+    for codec in SUPPORTED_CODECS:
+        if offered and codec in offered:
+            return codec
+    return CODEC_JSON
+
+def _encode_move(payload):
+    x, y, sx, sy = payload["pos"]
+    return _MOVE.pack(PROTOCOL_VERSION, MSG_MOVE, x, y, sx, sy)
+
+def _decode_move(data):
+    _, _, x, y, sx, sy = _MOVE.unpack_from(data)
+    return {"type": "move", "payload": {"pos": [x, y, sx, sy]}}
+
+def _encode_path(payload):
+    path = payload["path"]
+    parts = [_PATH_HEADER.pack(PROTOCOL_VERSION, MSG_PATH, payload["seq"] & 0xFFFF, len(path))]
+    pack_step = _STEP.pack
+    for x, y, sx, sy in path:
+        parts.append(pack_step(x, y, sx, sy))
+    return b"".join(parts)
+
+def _decode_path(data):
+    _, _, seq, count = _PATH_HEADER.unpack_from(data)
+    offset = _PATH_HEADER.size
+    steps = memoryview(data)[offset:offset + count * _STEP.size]
+    if len(steps) != count * _STEP.size:
+        raise ValueError("Truncated path frame")
+    return {"type": "path", "payload": {"seq": seq, "path": [list(step) for step in _STEP.iter_unpack(steps)]}}
+
+def _encode_tick(payload):
+    moves = payload.get("moves", ())
+    monsters = payload.get("monsters", ())
+    removed = payload.get("removed", ())
+    parts = [_TICK_HEADER.pack(PROTOCOL_VERSION, MSG_TICK, payload["tick"], len(moves), len(monsters), len(removed))]
+    pack_player = _PLAYER.pack
+    for m in moves:
+        x, y, sx, sy = m["pos"]
+        parts.append(pack_player(m["eid"], x, y, sx, sy))
+    pack_monster = _MONSTER.pack
+    for m in monsters:
+        x, y = m["pos"]
+        parts.append(pack_monster(m["eid"], x, y, MONSTER_TYPE_IDS.get(m["type"], 0), m["hp"]))
+    for eid in removed:
+        parts.append(_REMOVED.pack(eid))
+    return b"".join(parts)
+
+def _decode_tick(data):
+    _, _, tick, n_moves, n_monsters, n_removed = _TICK_HEADER.unpack_from(data)
+    data = memoryview(data)
+    offset = _TICK_HEADER.size
+    moves = []
+    for eid, x, y, sx, sy in _PLAYER.iter_unpack(data[offset:offset + n_moves * _PLAYER.size]):
+        moves.append({"eid": eid, "pos": [x, y, sx, sy]})
+    offset += n_moves * _PLAYER.size
+    monsters = []
+    for eid, x, y, type_id, hp in _MONSTER.iter_unpack(data[offset:offset + n_monsters * _MONSTER.size]):
+        monsters.append({"eid": eid, "pos": [x, y], "type": MONSTER_TYPES[type_id], "hp": hp})
+    offset += n_monsters * _MONSTER.size
+    removed = [eid for (eid,) in _REMOVED.iter_unpack(data[offset:offset + n_removed * _REMOVED.size])]
+    return {"type": "tick", "payload": {"tick": tick, "moves": moves, "monsters": monsters, "removed": removed}}
+
+_BINARY_ENCODERS = {
+    "move": _encode_move,
+    "tick": _encode_tick,
+    "path": _encode_path,
+}
+
+_BINARY_DECODERS = {
+    MSG_MOVE: _decode_move,
+    MSG_TICK: _decode_tick,
+    MSG_PATH: _decode_path,
+}
+
+def encode_message(message, codec=CODEC_JSON):
+    """Encode a message for the wire. Types without a binary layout are always sent as JSON text."""
+    if codec == CODEC_BINARY:
+        encoder = _BINARY_ENCODERS.get(message["type"])
+        if encoder:
+            return encoder(message["payload"])
+    return json.dumps(message)
+
+def decode_message(raw):
+    """Decode a text (JSON) or binary frame into a message dict. Raises ValueError on malformed input."""
+    if isinstance(raw, str):
+        return json.loads(raw)
+    try:
+        version, msg_type = _HEADER.unpack_from(raw)
+        if version != PROTOCOL_VERSION:
+            raise ValueError(f"Unsupported protocol version {version}")
+        decoder = _BINARY_DECODERS.get(msg_type)
+        if decoder is None:
+            raise ValueError(f"Unknown binary message type {msg_type}")
+        return decoder(raw)
+    except (struct.error, IndexError) as e:
+        raise ValueError(f"Malformed binary frame: {e}") from e